@@ -0,0 +1,503 @@
+"""Production launcher: N worker processes behind a session-affinity dispatcher.
+
+ChatService and TerminalService keep their state in process memory, so every
+request for a session or conversation has to reach the same worker. The
+dispatcher consistently hashes the session_id / conversation_id of each
+request onto a ring of workers and proxies it there; new sessions get an ID
+chosen by the dispatcher so they are created on the worker that will own them.
+
+Whenever the ring changes (a worker joins, leaves, or is restarted after a
+crash) the old ring is kept. A request for a key is preceded by a handoff
+from whichever older owner still holds it, and a background rebalance moves
+every remaining misplaced key; only then are the old rings dropped. A worker
+being scaled down is drained before it stops. Crashed workers are restarted
+with the same ID, so they take back the same share of the ring.
+
+Start with: python -m app.launcher --workers 4
+Send SIGUSR1 to add a worker and SIGUSR2 to remove one.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import uuid
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+logger = logging.getLogger("app.launcher")
+
+# Requests addressing an existing session or conversation in the path
+KEYED_PATHS = [
+    (re.compile(r"^/terminal/session/(?!create$)([^/]+)"), "terminal"),
+    (re.compile(r"^/chat/conversation/([^/]+)"), "chat")
+]
+# Requests that may create a session or conversation, and the body field naming an existing one
+CREATING_ROUTES = {
+    ("POST", "/terminal/execute"): ("terminal", "session_id"),
+    ("POST", "/terminal/session/create"): ("terminal", None),
+    ("POST", "/chat/message"): ("chat", "conversation_id")
+}
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "upgrade", "host", "content-length"}
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+    
+    def __init__(self, nodes: Tuple[str, ...] = (), replicas: int = 128):
+        self.replicas = replicas
+        self.nodes: List[str] = []
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes:
+            self.add(node)
+    
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+    
+    def _rebuild(self) -> None:
+        ring = sorted(
+            (self._hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(self.replicas)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+    
+    def add(self, node: str) -> None:
+        if node not in self.nodes:
+            self.nodes.append(node)
+            self._rebuild()
+    
+    def remove(self, node: str) -> None:
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._rebuild()
+    
+    def copy(self) -> "HashRing":
+        return HashRing(tuple(self.nodes), self.replicas)
+    
+    def lookup(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[index]
+
+class Worker:
+    """One uvicorn process serving app.main:app on a local port"""
+    
+    def __init__(self, worker_id: str, port: int):
+        self.worker_id = worker_id
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.process: Optional[subprocess.Popen] = None
+        self.stopping = False
+    
+    def start(self) -> None:
+        env = os.environ.copy()
+        env["LEARNCLI_WORKER_ID"] = self.worker_id
+        # Each worker journals its own sessions
+        if env.get("TERMINAL_JOURNAL_DIR"):
+            env["TERMINAL_JOURNAL_DIR"] = os.path.join(env["TERMINAL_JOURNAL_DIR"], self.worker_id)
+        self.stopping = False
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(self.port)],
+            env=env
+        )
+    
+    def stop(self) -> None:
+        self.stopping = True
+        if self.process is not None and self.process.poll() is None:
+            # SIGTERM lets uvicorn run shutdown handlers, e.g. flushing the journal
+            self.process.terminate()
+    
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+class Dispatcher:
+    def __init__(self, base_port: int, workers: int):
+        self.base_port = base_port
+        self.initial_workers = workers
+        self.workers: Dict[str, Worker] = {}
+        self.ring = HashRing()
+        # Rings from before the latest changes, oldest first. A key may still live on
+        # any of their owners until a rebalance has confirmed every key is in place.
+        self.ring_history: List[HashRing] = []
+        # Bumped on every ring change; requests are counted per generation they were routed in
+        self._generation = 0
+        self._in_flight: Dict[int, int] = {}
+        # Keys known to be on their owner under the current ring
+        self._placed: Set[str] = set()
+        # One move per key at a time, shared by concurrent requests and the rebalance
+        self._moves: Dict[str, asyncio.Task] = {}
+        self._rebalance_task: Optional[asyncio.Task] = None
+        self._round_robin = itertools.count()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self._scaling = asyncio.Lock()
+    
+    # Lifecycle
+    
+    async def startup(self) -> None:
+        self._client = httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_keepalive_connections=64))
+        workers = await asyncio.gather(*(self._start_worker() for _ in range(self.initial_workers)))
+        # Nothing to hand off between workers that just started
+        self.ring = HashRing(tuple(worker.worker_id for worker in workers if worker is not None))
+        
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.ensure_future(self.add_worker()))
+        loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.ensure_future(self.remove_worker()))
+        self._supervisor = asyncio.create_task(self._supervise())
+    
+    async def shutdown(self) -> None:
+        for task in (self._supervisor, self._rebalance_task):
+            if task is not None:
+                task.cancel()
+        for worker in self.workers.values():
+            worker.stop()
+        for worker in self.workers.values():
+            if worker.process is not None:
+                await asyncio.get_running_loop().run_in_executor(None, worker.process.wait)
+        if self._client is not None:
+            await self._client.aclose()
+    
+    async def _wait_healthy(self, worker: Worker, timeout: float = 60.0) -> bool:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while asyncio.get_running_loop().time() < deadline and worker.alive:
+            try:
+                if (await self._client.get(f"{worker.url}/")).status_code == 200:
+                    return True
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        return False
+    
+    async def _start_worker(self) -> Optional[Worker]:
+        """Start a worker on the next free ID and wait until it serves requests"""
+        index = next(i for i in itertools.count() if f"worker-{i}" not in self.workers)
+        worker = Worker(f"worker-{index}", self.base_port + 1 + index)
+        self.workers[worker.worker_id] = worker
+        worker.start()
+        if await self._wait_healthy(worker):
+            return worker
+        logger.error("Worker %s did not become healthy", worker.worker_id)
+        return None
+    
+    def _set_ring(self, ring: HashRing) -> None:
+        """Route with a new ring; keys are looked up on the older rings until a rebalance has moved them"""
+        self.ring_history.append(self.ring)
+        self.ring = ring
+        self._generation += 1
+        self._placed = set()
+        if self._rebalance_task is None or self._rebalance_task.done():
+            self._rebalance_task = asyncio.ensure_future(self._rebalance())
+    
+    def _join(self, worker: Worker) -> None:
+        """Add a healthy worker to the ring; keys it now owns move over"""
+        ring = self.ring.copy()
+        ring.add(worker.worker_id)
+        self._set_ring(ring)
+        logger.info("Worker %s joined (%d on the ring)", worker.worker_id, len(self.ring.nodes))
+    
+    def _leave(self, worker_id: str) -> None:
+        ring = self.ring.copy()
+        ring.remove(worker_id)
+        self._set_ring(ring)
+    
+    async def add_worker(self) -> None:
+        async with self._scaling:
+            worker = await self._start_worker()
+            if worker is not None:
+                self._join(worker)
+    
+    async def remove_worker(self, worker_id: Optional[str] = None) -> None:
+        """Take a worker off the ring, move its sessions and conversations to their new owners, then stop it"""
+        async with self._scaling:
+            if worker_id is None:
+                if len(self.ring.nodes) <= 1:
+                    return
+                worker_id = self.ring.nodes[-1]
+            worker = self.workers[worker_id]
+            self._leave(worker_id)
+            
+            # Requests routed before the change may still create sessions on the worker
+            await self._wait_for_older_requests(self._generation)
+            remaining = None
+            for _ in range(3):
+                remaining = await self._drain(worker)
+                if remaining == 0:
+                    break
+            if remaining != 0:
+                # Stopping it now would lose whatever couldn't be moved
+                logger.error("Could not drain worker %s, keeping it on the ring", worker_id)
+                self._join(worker)
+                return
+            
+            worker.stop()
+            del self.workers[worker_id]
+            logger.info("Worker %s left (%d on the ring)", worker_id, len(self.ring.nodes))
+    
+    async def _supervise(self) -> None:
+        """Restart crashed workers; their ring share goes to the others until they are back"""
+        while True:
+            await asyncio.sleep(1.0)
+            for worker in list(self.workers.values()):
+                if worker.alive or worker.stopping:
+                    continue
+                logger.warning("Worker %s exited, restarting", worker.worker_id)
+                async with self._scaling:
+                    if worker.worker_id in self.ring.nodes:
+                        self._leave(worker.worker_id)
+                    worker.start()
+                    if await self._wait_healthy(worker):
+                        self._join(worker)
+    
+    # Session handoff
+    
+    async def _move(self, kind: str, key: str, source: Worker, target: Worker) -> bool:
+        """Move one key from source to target; False if source doesn't hold it.
+        
+        If the target fails to adopt it, the released payload is put back on
+        the source before the error is raised, so the session isn't lost.
+        """
+        released = await self._client.post(f"{source.url}/internal/{kind}/{key}/release")
+        if released.status_code == 404:
+            return False
+        released.raise_for_status()
+        
+        try:
+            adopted = await self._client.post(
+                f"{target.url}/internal/{kind}/adopt",
+                content=released.content,
+                headers={"content-type": "application/json"}
+            )
+            adopted.raise_for_status()
+        except httpx.HTTPError:
+            try:
+                restored = await self._client.post(
+                    f"{source.url}/internal/{kind}/adopt",
+                    content=released.content,
+                    headers={"content-type": "application/json"}
+                )
+                restored.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.error("Lost %s %s: could not return it to %s: %s", kind, key, source.worker_id, e)
+            raise
+        return True
+    
+    async def _place(self, kind: str, key: str, holders: List[str]) -> str:
+        """Move a key from whichever of holders has it to its owner; return the worker that now holds it"""
+        generation = self._generation
+        owner = self.ring.lookup(key)
+        for holder in holders:
+            if holder == owner or holder not in self.workers:
+                continue
+            try:
+                if await self._move(kind, key, self.workers[holder], self.workers[owner]):
+                    break
+            except httpx.HTTPError as e:
+                # The key is back on (or never left) the holder, keep serving it from there
+                logger.warning("Handoff of %s %s from %s failed: %s", kind, key, holder, e)
+                return holder
+        if generation == self._generation:
+            self._placed.add(key)
+        return owner
+    
+    async def _locate(self, kind: str, key: str, holders: Optional[List[str]] = None) -> str:
+        """Worker to send a request for key to, pulling the key over from an older owner first"""
+        owner = self.ring.lookup(key)
+        if holders is None and (not self.ring_history or key in self._placed):
+            return owner
+        
+        task = self._moves.get(key)
+        if task is None:
+            if holders is None:
+                # Most recent owners first; a key moves at most once per ring change
+                holders = []
+                for ring in reversed(self.ring_history):
+                    previous = ring.lookup(key)
+                    if previous is not None and previous not in holders:
+                        holders.append(previous)
+            task = asyncio.ensure_future(self._place(kind, key, holders))
+            self._moves[key] = task
+            task.add_done_callback(lambda _: self._moves.pop(key, None))
+        return await task
+    
+    async def _wait_for_older_requests(self, generation: int) -> None:
+        while any(count for routed_in, count in self._in_flight.items() if routed_in < generation):
+            await asyncio.sleep(0.05)
+    
+    async def _drain(self, worker: Worker) -> Optional[int]:
+        """Move every key on worker that it doesn't own; return how many are left, or None if unreachable"""
+        try:
+            keys = (await self._client.get(f"{worker.url}/internal/keys")).json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning("Could not list keys on worker %s: %s", worker.worker_id, e)
+            return None
+        remaining = 0
+        for kind, ids in keys.items():
+            for key in ids:
+                if self.ring.lookup(key) != worker.worker_id:
+                    if await self._locate(kind, key, [worker.worker_id]) != self.ring.lookup(key):
+                        remaining += 1
+        return remaining
+    
+    async def _rebalance(self) -> None:
+        """Move every misplaced key to its owner, then forget the older rings"""
+        while self.ring_history:
+            generation = self._generation
+            await self._wait_for_older_requests(generation)
+            
+            complete = True
+            for worker in list(self.workers.values()):
+                if not worker.alive:
+                    # Its keys come back with it (from its journal); until then keep looking them up there
+                    complete = complete and worker.stopping
+                    continue
+                if await self._drain(worker) != 0:
+                    complete = False
+            
+            if generation != self._generation:
+                continue
+            if complete:
+                self.ring_history = []
+                self._placed = set()
+                logger.info("Rebalance complete (%d on the ring)", len(self.ring.nodes))
+            else:
+                await asyncio.sleep(1.0)
+    
+    # Routing
+    
+    def _affinity(self, request: Request, body: bytes) -> Tuple[Optional[str], Optional[str], bool]:
+        """Return (kind, key, may_create) for a request"""
+        path = request.url.path
+        for pattern, kind in KEYED_PATHS:
+            match = pattern.match(path)
+            if match:
+                return kind, match.group(1), False
+        
+        route = CREATING_ROUTES.get((request.method, path))
+        if route is None:
+            return None, None, False
+        kind, field = route
+        key = request.query_params.get(field) if field else None
+        if field and body and key is None:
+            try:
+                key = json.loads(body).get(field)
+            except (ValueError, AttributeError):
+                key = None
+        return kind, key, True
+    
+    def _new_key_for(self, owner: Optional[str]) -> str:
+        """A fresh ID that hashes to owner (or anywhere if owner is None)"""
+        for _ in range(64 * max(1, len(self.ring.nodes))):
+            key = str(uuid.uuid4())
+            if owner is None or self.ring.lookup(key) == owner:
+                return key
+        return key
+    
+    async def handle(self, request: Request) -> Response:
+        if request.url.path.startswith("/internal"):
+            return JSONResponse({"detail": "Not Found"}, status_code=404)
+        if request.url.path == "/_dispatcher/status":
+            return JSONResponse({
+                "workers": {worker_id: worker.alive for worker_id, worker in self.workers.items()},
+                "ring": self.ring.nodes
+            })
+        if not self.ring.nodes:
+            return JSONResponse({"detail": "No workers available"}, status_code=503)
+        
+        generation = self._generation
+        self._in_flight[generation] = self._in_flight.get(generation, 0) + 1
+        try:
+            return await self._route(request)
+        finally:
+            self._in_flight[generation] -= 1
+            if not self._in_flight[generation]:
+                del self._in_flight[generation]
+    
+    async def _route(self, request: Request) -> Response:
+        body = await request.body()
+        kind, key, may_create = self._affinity(request, body)
+        # The affinity header is only ever set by the dispatcher
+        headers = {
+            k: v for k, v in request.headers.items()
+            if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() != "x-affinity-id"
+        }
+        
+        generated = False
+        if key is not None:
+            owner = await self._locate(kind, key)
+        elif may_create:
+            key = self._new_key_for(None)
+            owner = self.ring.lookup(key)
+            generated = True
+        else:
+            # Stateless request: any worker will do
+            owner = self.ring.nodes[next(self._round_robin) % len(self.ring.nodes)]
+        
+        if may_create:
+            # Used by the worker only if it has to create the session or conversation,
+            # so it must hash to the same worker as the request
+            headers["x-affinity-id"] = key if generated else self._new_key_for(owner)
+        
+        return await self._proxy(self.workers[owner], request, headers, body)
+    
+    async def _proxy(self, worker: Worker, request: Request, headers: Dict[str, str], body: bytes) -> Response:
+        url = worker.url + request.url.path
+        if request.url.query:
+            url += "?" + request.url.query
+        try:
+            upstream = await self._client.send(
+                self._client.build_request(request.method, url, headers=headers, content=body),
+                stream=True
+            )
+        except httpx.TransportError:
+            return JSONResponse({"detail": "Worker unavailable"}, status_code=503)
+        try:
+            # Pass the body through untouched, including any gzip encoding
+            content = b"".join([chunk async for chunk in upstream.aiter_raw()])
+        finally:
+            await upstream.aclose()
+        response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        return Response(content=content, status_code=upstream.status_code, headers=response_headers)
+
+def create_dispatcher_app(base_port: int, workers: int) -> Starlette:
+    dispatcher = Dispatcher(base_port, workers)
+    methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"]
+    app = Starlette(
+        routes=[Route("/{path:path}", dispatcher.handle, methods=methods)],
+        on_startup=[dispatcher.startup],
+        on_shutdown=[dispatcher.shutdown]
+    )
+    app.state.dispatcher = dispatcher
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run N API workers behind a session-affinity dispatcher")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--worker-base-port", type=int, default=9000,
+                        help="Workers listen on 127.0.0.1 from this port + 1 upwards")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    import uvicorn
+    uvicorn.run(create_dispatcher_app(args.worker_base_port, args.workers), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -12,7 +15,8 @@ load_dotenv()
 app = FastAPI(
     title="K8s and Git Learning API",
     description="API for mobile app to learn Kubernetes and Git with AI",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -24,10 +28,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger payloads (sessions, conversation histories)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include routers
 app.include_router(chat.router)
 app.include_router(terminal.router)
 
+# Session handoff endpoints, only exposed to the dispatcher in multi-worker mode
+if os.getenv("LEARNCLI_WORKER_ID"):
+    from app.routers import internal
+    app.include_router(internal.router)
+
+async def warm_up_chains():
+    """Build LLM clients and chains off the event loop so the first request doesn't pay for it"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, chat.get_chat_service().warm_up)
+    await loop.run_in_executor(None, terminal.get_terminal_service().warm_up)
+
+@app.on_event("startup")
+async def schedule_warm_up():
+    """Optionally start warming up the LLM chains in the background.
+    
+    The task is only scheduled here, so the server binds its port and starts
+    serving immediately while the heavy imports happen in a worker thread.
+    """
+    if os.getenv("WARMUP_LLM_CHAINS", "false").lower() in ("1", "true", "yes"):
+        app.state.warm_up_task = asyncio.create_task(warm_up_chains())
+
+@app.on_event("startup")
+async def recover_terminal_sessions():
+    """Replay the terminal session journal before serving, if it is enabled"""
+    if os.getenv("TERMINAL_JOURNAL_DIR"):
+        terminal.get_terminal_service()
+
+@app.on_event("shutdown")
+async def flush_terminal_journal():
+    """Make sure every journaled command is on disk before the worker exits"""
+    if os.getenv("TERMINAL_JOURNAL_DIR"):
+        terminal.get_terminal_service().close()
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -33,4 +33,10 @@ class ConversationHistory(BaseModel):
     user_id: Optional[str] = None
     messages: List[Message] = []
     created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
\ No newline at end of file
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+class ConversationPage(ConversationHistory):
+    """A window of a conversation's messages, used for paginated and delta sync reads"""
+    total_messages: int
+    start_index: int = 0
+    next_cursor: Optional[int] = None
@@ -22,6 +22,7 @@ class TerminalResponse(BaseModel):
 class TerminalSession(BaseModel):
     session_id: str
     user_id: Optional[str] = None
+    scenario: str = "default"
     environment_state: Dict[str, Any] = Field(default_factory=dict)
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
@@ -0,0 +1,48 @@
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+
+try:
+    import msgpack
+except ImportError:  # MessagePack encoding is optional
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/x-msgpack", "application/msgpack")
+
+class MsgPackResponse(Response):
+    media_type = "application/x-msgpack"
+    
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, use_bin_type=True)
+
+def _dump(content: Any, json_mode: bool) -> Any:
+    """Turn pydantic models (also nested in dicts/lists) into plain data without revalidating them"""
+    if isinstance(content, BaseModel):
+        return content.model_dump(mode="json" if json_mode else "python")
+    if isinstance(content, dict):
+        return {key: _dump(value, json_mode) for key, value in content.items()}
+    if isinstance(content, list):
+        return [_dump(value, json_mode) for value in content]
+    return content
+
+def wants_msgpack(request: Request) -> bool:
+    """Whether the client asked for MessagePack and it is available"""
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+def negotiated_response(request: Request,
+                        content: Any,
+                        status_code: int = 200,
+                        headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize trusted internal models as orjson or MessagePack based on the Accept header.
+    
+    Returning a Response directly skips FastAPI's response_model validation,
+    so only use this for models the service built itself.
+    """
+    headers = {**(headers or {}), "Vary": "Accept"}
+    if wants_msgpack(request):
+        # MessagePack has no datetime/enum types, so dump in JSON mode
+        return MsgPackResponse(_dump(content, json_mode=True), status_code=status_code, headers=headers)
+    # orjson serializes datetimes and enums natively
+    return ORJSONResponse(_dump(content, json_mode=False), status_code=status_code, headers=headers)
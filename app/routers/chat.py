@@ -1,18 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Request, Response
+from datetime import datetime
+from functools import lru_cache
 from typing import List, Optional
 
-from app.models.chat import ChatRequest, ChatResponse, ConversationHistory
+from app.models.chat import ChatRequest, ChatResponse, ConversationPage
+from app.responses import negotiated_response
 from app.services.chat_service import ChatService
+from llm.resilience import LLMUnavailableError
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 # Dependency to get the chat service
+# A single instance per worker keeps in-memory state and lazily built chains
+@lru_cache()
 def get_chat_service() -> ChatService:
     return ChatService()
 
 @router.post("/message", response_model=ChatResponse)
 async def process_message(
     request: ChatRequest,
+    affinity_id: Optional[str] = Header(None, alias="X-Affinity-Id"),
     chat_service: ChatService = Depends(get_chat_service)
 ):
     """Process a chat message and return the response"""
@@ -22,15 +29,30 @@ async def process_message(
             detail="Topic must be either 'kubernetes' or 'git'"
         )
     
-    response = await chat_service.process_chat_message(request)
+    try:
+        # A dispatcher in front of several workers picks the ID for new conversations
+        response = await chat_service.process_chat_message(request, new_conversation_id=affinity_id)
+    except LLMUnavailableError:
+        raise HTTPException(
+            status_code=503,
+            detail="The AI teacher is temporarily unavailable, please try again shortly"
+        )
     return response
 
-@router.get("/conversation/{conversation_id}", response_model=ConversationHistory)
+@router.get("/conversation/{conversation_id}", response_model=ConversationPage)
 async def get_conversation(
     conversation_id: str,
+    request: Request,
+    cursor: int = Query(0, ge=0, description="Index of the first message to return"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Maximum number of messages to return"),
+    since: Optional[str] = Query(
+        None,
+        description="Only return messages after this message index or ISO 8601 timestamp"
+    ),
+    if_none_match: Optional[str] = Header(None),
     chat_service: ChatService = Depends(get_chat_service)
 ):
-    """Get conversation history by ID"""
+    """Get conversation history by ID, optionally paginated or as a delta since the last sync"""
     conversation = await chat_service.get_conversation_history(conversation_id)
     if not conversation:
         raise HTTPException(
@@ -38,7 +60,42 @@ async def get_conversation(
             detail=f"Conversation with ID {conversation_id} not found"
         )
     
-    return conversation
+    since_index, since_timestamp = _parse_since(since)
+    page = await chat_service.get_conversation_page(
+        conversation,
+        cursor=cursor,
+        limit=limit,
+        since_index=since_index,
+        since_timestamp=since_timestamp
+    )
+    
+    # The tag covers this page's window; clients that already have it get a 304 before serialization
+    etag = chat_service.get_conversation_etag(conversation, page)
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in [tag.strip() for tag in if_none_match.split(",")]
+    ):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    return negotiated_response(request, page, headers={"ETag": etag})
+
+def _parse_since(since: Optional[str]):
+    """Split the `since` query parameter into a message index or a timestamp"""
+    if since is None:
+        return None, None
+    if since.isdigit():
+        return int(since), None
+    try:
+        timestamp = datetime.fromisoformat(since)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="'since' must be a message index or an ISO 8601 timestamp"
+        )
+    # Message timestamps are naive local times
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return None, timestamp
 
 @router.post("/conversation/{conversation_id}/introduce")
 async def introduce_topic(
@@ -54,9 +111,29 @@ async def introduce_topic(
             detail=f"Conversation with ID {conversation_id} not found"
         )
     
-    introduction = await chat_service.introduce_topic(conversation_id, subtopic)
+    try:
+        introduction = await chat_service.introduce_topic(conversation_id, subtopic)
+    except LLMUnavailableError:
+        raise HTTPException(
+            status_code=503,
+            detail="The AI teacher is temporarily unavailable, please try again shortly"
+        )
     return {"conversation_id": conversation_id, "introduction": introduction}
 
+@router.get("/memory")
+async def get_memory_stats(
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Get memory usage of resident and cold (compressed) conversations"""
+    return chat_service.get_memory_stats()
+
+@router.get("/metrics")
+async def get_metrics(
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Get chat metrics such as answer cache hit rate"""
+    return chat_service.get_metrics()
+
 @router.get("/topics")
 async def get_available_topics():
     """Get list of available learning topics"""
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, HTTPException, Depends
+
+from app.models.chat import ConversationHistory
+from app.models.terminal import TerminalSession
+from app.routers.chat import get_chat_service
+from app.routers.terminal import get_terminal_service
+from app.services.chat_service import ChatService
+from app.services.terminal_service import TerminalService
+
+# Endpoints used by app.launcher to move sessions and conversations between
+# workers when the set of workers changes. Only mounted in launcher workers.
+router = APIRouter(prefix="/internal", tags=["internal"], include_in_schema=False)
+
+@router.get("/keys")
+async def get_keys(
+    chat_service: ChatService = Depends(get_chat_service),
+    terminal_service: TerminalService = Depends(get_terminal_service)
+):
+    """List the session and conversation IDs held by this worker"""
+    return {
+        "terminal": list(terminal_service.sessions),
+        "chat": list(chat_service.conversations) + list(chat_service.cold_conversations)
+    }
+
+@router.post("/terminal/{session_id}/release", response_model=TerminalSession)
+async def release_session(
+    session_id: str,
+    terminal_service: TerminalService = Depends(get_terminal_service)
+):
+    """Hand a session over to another worker"""
+    session = await terminal_service.release_session(session_id)
+    if not session:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Session with ID {session_id} not found"
+        )
+    
+    return session
+
+@router.post("/terminal/adopt")
+async def adopt_session(
+    session: TerminalSession,
+    terminal_service: TerminalService = Depends(get_terminal_service)
+):
+    """Take over a session released by another worker"""
+    await terminal_service.adopt_session(session)
+    return {"session_id": session.session_id, "status": "adopted"}
+
+@router.post("/chat/{conversation_id}/release", response_model=ConversationHistory)
+async def release_conversation(
+    conversation_id: str,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Hand a conversation over to another worker"""
+    conversation = await chat_service.release_conversation(conversation_id)
+    if not conversation:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Conversation with ID {conversation_id} not found"
+        )
+    
+    return conversation
+
+@router.post("/chat/adopt")
+async def adopt_conversation(
+    conversation: ConversationHistory,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Take over a conversation released by another worker"""
+    await chat_service.adopt_conversation(conversation)
+    return {"conversation_id": conversation.conversation_id, "status": "adopted"}
@@ -1,27 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends, Path
+from fastapi import APIRouter, HTTPException, Depends, Header, Path, Query, Request
+from functools import lru_cache
 from typing import Optional
 
 from app.models.terminal import TerminalRequest, TerminalResponse, TerminalSession
 from app.services.terminal_service import TerminalService
+from app.services.scenarios import list_scenarios
+from app.responses import negotiated_response
 
 router = APIRouter(prefix="/terminal", tags=["terminal"])
 
 # Dependency to get the terminal service
+# A single instance per worker keeps in-memory state and lazily built chains
+@lru_cache()
 def get_terminal_service() -> TerminalService:
     return TerminalService()
 
 @router.post("/execute", response_model=TerminalResponse)
 async def execute_command(
     request: TerminalRequest,
+    affinity_id: Optional[str] = Header(None, alias="X-Affinity-Id"),
     terminal_service: TerminalService = Depends(get_terminal_service)
 ):
     """Execute a terminal command and return the output"""
-    response = await terminal_service.process_command(request)
+    # A dispatcher in front of several workers picks the ID for new sessions
+    response = await terminal_service.process_command(request, new_session_id=affinity_id)
     return response
 
 @router.get("/session/{session_id}", response_model=TerminalSession)
 async def get_session(
     session_id: str,
+    request: Request,
     terminal_service: TerminalService = Depends(get_terminal_service)
 ):
     """Get terminal session state by ID"""
@@ -32,7 +40,24 @@ async def get_session(
             detail=f"Session with ID {session_id} not found"
         )
     
-    return session
+    return negotiated_response(request, session)
+
+@router.get("/session/{session_id}/complete")
+async def complete_command(
+    session_id: str,
+    prefix: str = Query("", description="The partially typed command line"),
+    limit: int = Query(20, ge=1, le=100),
+    terminal_service: TerminalService = Depends(get_terminal_service)
+):
+    """Complete the last token of a command from subcommands, flags and live resource names"""
+    completions = await terminal_service.complete_command(session_id, prefix, limit)
+    if completions is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Session with ID {session_id} not found"
+        )
+    
+    return {"session_id": session_id, "prefix": prefix, "completions": completions}
 
 @router.post("/session/{session_id}/reset")
 async def reset_session(
@@ -51,19 +76,36 @@ async def reset_session(
 
 @router.post("/session/create")
 async def create_session(
+    request: Request,
     user_id: Optional[str] = None,
+    scenario: str = Query("default", description="Scenario template to start the session from"),
+    affinity_id: Optional[str] = Header(None, alias="X-Affinity-Id"),
     terminal_service: TerminalService = Depends(get_terminal_service)
 ):
     """Create a new terminal session"""
-    # Create an empty request to generate a new session
-    request = TerminalRequest(command="echo 'Session initialized'", user_id=user_id)
-    response = await terminal_service.process_command(request)
-    
-    # Get the new session
-    session = await terminal_service.get_session(response.session_id)
+    try:
+        session = await terminal_service.create_session(
+            user_id=user_id,
+            scenario=scenario,
+            session_id=affinity_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {
-        "session_id": response.session_id,
+    return negotiated_response(request, {
+        "session_id": session.session_id,
         "status": "created",
         "session": session
-    }
\ No newline at end of file
+    })
+
+@router.get("/metrics")
+async def get_metrics(
+    terminal_service: TerminalService = Depends(get_terminal_service)
+):
+    """Get terminal simulation metrics"""
+    return terminal_service.get_metrics()
+
+@router.get("/scenarios")
+async def get_scenarios():
+    """Get list of available lab scenario templates"""
+    return {"scenarios": list_scenarios()}
\ No newline at end of file
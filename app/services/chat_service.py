@@ -1,36 +1,163 @@
 from typing import Dict, List, Optional, Any
+import asyncio
+import bisect
+import functools
+import json
+import os
+import sys
+import time
 import uuid
+import zlib
 from datetime import datetime
 
-from app.models.chat import ChatRequest, ChatResponse, ConversationHistory, Message
+from app.models.chat import ChatRequest, ChatResponse, ConversationHistory, ConversationPage, Message
 from llm.chains.chat_chains import ChatLearningChain
 
+# Conversations untouched for this long are compressed into cold storage
+CONVERSATION_IDLE_SECONDS = float(os.getenv("CONVERSATION_IDLE_SECONDS", "900"))
+# Minimum time between two sweeps for idle conversations
+CONVERSATION_SWEEP_INTERVAL_SECONDS = float(os.getenv("CONVERSATION_SWEEP_INTERVAL_SECONDS", "60"))
+
+def _encode_conversation(conversation: ConversationHistory) -> bytes:
+    """Pack a conversation into a compact, zlib-compressed JSON blob"""
+    payload = [
+        conversation.conversation_id,
+        conversation.topic.value,
+        conversation.user_id,
+        conversation.created_at.isoformat(),
+        conversation.updated_at.isoformat(),
+        [[msg.role.value, msg.content, msg.timestamp.isoformat()] for msg in conversation.messages]
+    ]
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+def _decode_conversation(blob: bytes) -> ConversationHistory:
+    """Rebuild a conversation from a blob produced by _encode_conversation"""
+    conversation_id, topic, user_id, created_at, updated_at, messages = json.loads(zlib.decompress(blob))
+    return ConversationHistory(
+        conversation_id=conversation_id,
+        topic=topic,
+        user_id=user_id,
+        created_at=datetime.fromisoformat(created_at),
+        updated_at=datetime.fromisoformat(updated_at),
+        messages=[
+            Message(role=role, content=content, timestamp=datetime.fromisoformat(timestamp))
+            for role, content, timestamp in messages
+        ]
+    )
+
+def _estimate_resident_bytes(conversation: ConversationHistory) -> int:
+    """Rough in-memory footprint of a conversation and its message models"""
+    size = sys.getsizeof(conversation) + sys.getsizeof(conversation.__dict__)
+    size += sys.getsizeof(conversation.messages)
+    for msg in conversation.messages:
+        size += sys.getsizeof(msg) + sys.getsizeof(msg.__dict__)
+        size += sys.getsizeof(msg.content) + sys.getsizeof(msg.timestamp)
+    return size
+
 class ChatService:
     def __init__(self):
         # In-memory storage for conversation histories
         # In production, you would use a database
         self.conversations: Dict[str, ConversationHistory] = {}
         
+        # Idle conversations, compressed with _encode_conversation
+        self.cold_conversations: Dict[str, bytes] = {}
+        self._last_sweep = time.monotonic()
+        
+        # Messages in one conversation are answered one at a time while the LLM call runs off the event loop
+        self.conversation_locks: Dict[str, asyncio.Lock] = {}
+        
+        # Behind app.launcher the dispatcher picks the IDs of new conversations
+        self.accept_affinity_ids = bool(os.getenv("LEARNCLI_WORKER_ID"))
+        
+        # Opt-in cache of answers to frequent first-turn questions, shared by both topics
+        self.answer_cache = None
+        if os.getenv("CHAT_ANSWER_CACHE", "false").lower() in ("1", "true", "yes"):
+            from llm.answer_cache import SemanticAnswerCache
+            self.answer_cache = SemanticAnswerCache(
+                threshold=float(os.getenv("CHAT_ANSWER_CACHE_THRESHOLD", "0.92")),
+                max_entries=int(os.getenv("CHAT_ANSWER_CACHE_SIZE", "512"))
+            )
+        
         # Initialize learning chains for different topics
+        # (cheap: the LLM client and LangChain objects are built on first use)
         self.chains: Dict[str, ChatLearningChain] = {
-            "kubernetes": ChatLearningChain(topic="kubernetes"),
-            "git": ChatLearningChain(topic="git")
+            "kubernetes": ChatLearningChain(topic="kubernetes", answer_cache=self.answer_cache),
+            "git": ChatLearningChain(topic="git", answer_cache=self.answer_cache)
+        }
+    
+    def _get_conversation(self, conversation_id: Optional[str]) -> Optional[ConversationHistory]:
+        """Look up a conversation, rehydrating it from cold storage if needed"""
+        if not conversation_id:
+            return None
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None and conversation_id in self.cold_conversations:
+            conversation = _decode_conversation(self.cold_conversations.pop(conversation_id))
+            self.conversations[conversation_id] = conversation
+        return conversation
+    
+    def demote_idle_conversations(self, idle_seconds: float = CONVERSATION_IDLE_SECONDS) -> int:
+        """Move conversations idle for longer than idle_seconds into cold storage"""
+        now = datetime.now()
+        idle_ids = [
+            conversation_id
+            for conversation_id, conversation in self.conversations.items()
+            if (now - conversation.updated_at).total_seconds() > idle_seconds
+            and not self._is_busy(conversation_id)
+        ]
+        for conversation_id in idle_ids:
+            self.conversation_locks.pop(conversation_id, None)
+            self.cold_conversations[conversation_id] = _encode_conversation(
+                self.conversations.pop(conversation_id)
+            )
+        self._last_sweep = time.monotonic()
+        return len(idle_ids)
+    
+    def _maybe_demote_idle_conversations(self) -> None:
+        """Sweep for idle conversations at most once per sweep interval"""
+        if time.monotonic() - self._last_sweep >= CONVERSATION_SWEEP_INTERVAL_SECONDS:
+            self.demote_idle_conversations()
+    
+    def get_memory_stats(self) -> Dict[str, Any]:
+        """Report how many conversations are resident or cold and roughly how much memory each uses"""
+        return {
+            "resident_conversations": len(self.conversations),
+            "resident_bytes": sum(_estimate_resident_bytes(c) for c in self.conversations.values()),
+            "cold_conversations": len(self.cold_conversations),
+            "cold_bytes": sum(len(blob) for blob in self.cold_conversations.values()),
+            "idle_seconds": CONVERSATION_IDLE_SECONDS
         }
     
-    async def process_chat_message(self, request: ChatRequest) -> ChatResponse:
+    def get_metrics(self) -> Dict[str, Any]:
+        """Answer cache metrics, if the cache is enabled, and LLM call resilience metrics"""
+        return {
+            "answer_cache": self.answer_cache.get_stats() if self.answer_cache is not None else None,
+            "resilience": self.chains["kubernetes"].invoker.get_metrics()
+        }
+    
+    def warm_up(self) -> None:
+        """Build the LLM chains ahead of the first chat message"""
+        for chain in self.chains.values():
+            chain.warm_up()
+    
+    async def process_chat_message(self, request: ChatRequest, new_conversation_id: Optional[str] = None) -> ChatResponse:
         """Process a user chat message and return the assistant's response"""
+        self._maybe_demote_idle_conversations()
+        
         # Get or create conversation
         conversation_id = request.conversation_id
-        if not conversation_id or conversation_id not in self.conversations:
-            conversation_id = str(uuid.uuid4())
-            self.conversations[conversation_id] = ConversationHistory(
-                conversation_id=conversation_id,
-                topic=request.topic,
-                user_id=request.user_id,
-                messages=[]
-            )
+        if self._get_conversation(conversation_id) is None:
+            conversation_id = self._create_conversation(request, new_conversation_id).conversation_id
         
-        conversation = self.conversations[conversation_id]
+        async with self._conversation_lock(conversation_id):
+            return await self._process_chat_message(request, conversation_id)
+    
+    async def _process_chat_message(self, request: ChatRequest, conversation_id: str) -> ChatResponse:
+        # The conversation may have been handed to another worker while this message waited
+        conversation = self._get_conversation(conversation_id)
+        if conversation is None:
+            conversation = self._create_conversation(request)
+            conversation_id = conversation.conversation_id
         
         # Add user message to conversation history
         user_message = Message(
@@ -53,9 +180,10 @@ class ChatService:
             
             # Process the message
             chain = self.chains[topic]
-            assistant_response = chain.process_message(
-                request.user_message,
-                conversation_history=message_dicts
+            loop = asyncio.get_running_loop()
+            assistant_response = await loop.run_in_executor(
+                None,
+                functools.partial(chain.process_message, request.user_message, conversation_history=message_dicts)
             )
             
             assistant_message = assistant_response
@@ -76,32 +204,130 @@ class ChatService:
             conversation_id=conversation_id
         )
     
+    def _create_conversation(self, request: ChatRequest, conversation_id: Optional[str] = None) -> ConversationHistory:
+        conversation = ConversationHistory(
+            conversation_id=self._new_conversation_id(conversation_id),
+            topic=request.topic,
+            user_id=request.user_id,
+            messages=[]
+        )
+        self.conversations[conversation.conversation_id] = conversation
+        return conversation
+    
+    def _new_conversation_id(self, requested: Optional[str]) -> str:
+        """Use a dispatcher-chosen ID only in launcher workers, and never one that is taken"""
+        if (
+            requested
+            and self.accept_affinity_ids
+            and requested not in self.conversations
+            and requested not in self.cold_conversations
+        ):
+            return requested
+        return str(uuid.uuid4())
+    
+    def _is_busy(self, conversation_id: str) -> bool:
+        """Whether a message or introduction is being generated for the conversation"""
+        lock = self.conversation_locks.get(conversation_id)
+        return lock is not None and lock.locked()
+    
+    def _conversation_lock(self, conversation_id: str) -> asyncio.Lock:
+        lock = self.conversation_locks.get(conversation_id)
+        if lock is None:
+            lock = self.conversation_locks[conversation_id] = asyncio.Lock()
+        return lock
+    
     async def get_conversation_history(self, conversation_id: str) -> Optional[ConversationHistory]:
         """Get conversation history by ID"""
-        return self.conversations.get(conversation_id)
+        return self._get_conversation(conversation_id)
+    
+    async def release_conversation(self, conversation_id: str) -> Optional[ConversationHistory]:
+        """Remove a conversation from this worker so another one can adopt it"""
+        # Wait for a message in progress so its reply moves with the conversation
+        async with self._conversation_lock(conversation_id):
+            conversation = self._get_conversation(conversation_id)
+            if conversation is not None:
+                del self.conversations[conversation_id]
+        self.conversation_locks.pop(conversation_id, None)
+        return conversation
+    
+    async def adopt_conversation(self, conversation: ConversationHistory) -> None:
+        """Take over a conversation released by another worker"""
+        self.cold_conversations.pop(conversation.conversation_id, None)
+        self.conversations[conversation.conversation_id] = conversation
+    
+    async def get_conversation_page(self,
+                                    conversation: ConversationHistory,
+                                    cursor: int = 0,
+                                    limit: Optional[int] = None,
+                                    since_index: Optional[int] = None,
+                                    since_timestamp: Optional[datetime] = None) -> ConversationPage:
+        """Return a slice of the conversation's messages.
+        
+        `cursor` is the index of the first message to return, `since_index`
+        and `since_timestamp` skip everything up to and including that message
+        or time. Messages are appended in order, so the timestamp lookup is a
+        binary search rather than a scan.
+        """
+        messages = conversation.messages
+        total = len(messages)
+        
+        start = max(cursor, 0)
+        if since_index is not None:
+            start = max(start, since_index + 1)
+        if since_timestamp is not None:
+            start = max(start, bisect.bisect_right(messages, since_timestamp, key=lambda m: m.timestamp))
+        start = min(start, total)
+        
+        end = total if limit is None else min(start + limit, total)
+        
+        return ConversationPage(
+            conversation_id=conversation.conversation_id,
+            topic=conversation.topic,
+            user_id=conversation.user_id,
+            messages=messages[start:end],
+            created_at=conversation.created_at,
+            updated_at=conversation.updated_at,
+            total_messages=total,
+            start_index=start,
+            next_cursor=end if end < total else None
+        )
+    
+    def get_conversation_etag(self, conversation: ConversationHistory, page: ConversationPage) -> str:
+        """Version tag for one page of a conversation.
+        
+        Changes whenever a message is added, and differs between pages so a
+        paginating client's tag for one window never matches another.
+        """
+        end = page.start_index + len(page.messages)
+        return (
+            f'W/"{conversation.conversation_id}-{len(conversation.messages)}-'
+            f'{conversation.updated_at.timestamp()}-{page.start_index}-{end}"'
+        )
     
     async def introduce_topic(self, conversation_id: str, subtopic: str) -> str:
         """Generate an introduction to a specific subtopic"""
-        if conversation_id not in self.conversations:
-            return "Conversation not found"
+        async with self._conversation_lock(conversation_id):
+            conversation = self._get_conversation(conversation_id)
+            if conversation is None:
+                return "Conversation not found"
+                
+            topic = conversation.topic.lower()
             
-        conversation = self.conversations[conversation_id]
-        topic = conversation.topic.lower()
-        
-        if topic not in self.chains:
-            return "Topic not supported"
+            if topic not in self.chains:
+                return "Topic not supported"
+                
+            chain = self.chains[topic]
+            loop = asyncio.get_running_loop()
+            introduction = await loop.run_in_executor(None, chain.introduce_topic, subtopic)
             
-        chain = self.chains[topic]
-        introduction = chain.introduce_topic(subtopic)
-        
-        # Add system message to conversation history
-        conversation.messages.append(
-            Message(
-                role="assistant",
-                content=introduction,
-                timestamp=datetime.now()
+            # Add system message to conversation history
+            conversation.messages.append(
+                Message(
+                    role="assistant",
+                    content=introduction,
+                    timestamp=datetime.now()
+                )
             )
-        )
-        conversation.updated_at = datetime.now()
+            conversation.updated_at = datetime.now()
         
         return introduction
\ No newline at end of file
@@ -0,0 +1,221 @@
+from typing import Dict, Iterable, List, Any, Set
+
+from llm.cli_tokens import GIT_VALUE_FLAGS, KUBECTL_VALUE_FLAGS, namespace_flag, positional_args
+
+# Static command vocabulary for the simulated tools
+KUBECTL_SUBCOMMANDS = [
+    "annotate", "apply", "config", "create", "delete", "describe", "edit", "exec",
+    "expose", "get", "label", "logs", "patch", "port-forward", "rollout", "run",
+    "scale", "set", "top"
+]
+KUBECTL_RESOURCE_TYPES = ["deployments", "namespaces", "pods", "services"]
+KUBECTL_FLAGS = [
+    "--all-namespaces", "--container", "--dry-run", "--filename", "--follow", "--help",
+    "--image", "--labels", "--namespace", "--output", "--replicas", "--selector",
+    "--watch", "-A", "-c", "-f", "-h", "-l", "-n", "-o", "-w"
+]
+GIT_SUBCOMMANDS = [
+    "add", "branch", "checkout", "cherry-pick", "clone", "commit", "diff", "fetch",
+    "init", "log", "merge", "pull", "push", "rebase", "remote", "reset", "restore",
+    "revert", "rm", "show", "stash", "status", "switch", "tag"
+]
+GIT_FLAGS = [
+    "--abort", "--all", "--amend", "--continue", "--force", "--hard", "--help",
+    "--message", "--no-ff", "--oneline", "--soft", "--staged", "-a", "-b", "-d",
+    "-D", "-m", "-u"
+]
+
+# Which kind of live resource completes the argument of a subcommand
+KUBECTL_RESOURCE_ALIASES = {
+    "po": "pods", "pod": "pods", "pods": "pods",
+    "deploy": "deployments", "deployment": "deployments", "deployments": "deployments",
+    "svc": "services", "service": "services", "services": "services",
+    "ns": "namespaces", "namespace": "namespaces", "namespaces": "namespaces"
+}
+KUBECTL_POD_SUBCOMMANDS = {"exec", "logs", "port-forward"}
+GIT_BRANCH_SUBCOMMANDS = {"branch", "checkout", "cherry-pick", "merge", "rebase", "switch"}
+GIT_FILE_SUBCOMMANDS = {"add", "diff", "restore", "rm"}
+
+_END = ""
+
+class PrefixIndex:
+    """A character trie supporting incremental inserts/removals and prefix lookups"""
+    
+    def __init__(self, words: Iterable[str] = ()):
+        self._root: Dict[str, Any] = {}
+        for word in words:
+            self.insert(word)
+    
+    def insert(self, word: str) -> None:
+        node = self._root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[_END] = True
+    
+    def remove(self, word: str) -> None:
+        path = [self._root]
+        for char in word:
+            node = path[-1].get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].pop(_END, None)
+        
+        # Prune branches that no longer lead to any word
+        for depth in range(len(word), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][word[depth - 1]]
+    
+    def complete(self, prefix: str, limit: int = 20) -> List[str]:
+        """Return up to `limit` words starting with prefix, in sorted order"""
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        
+        results: List[str] = []
+        stack = [(prefix, node)]
+        while stack and len(results) < limit:
+            word, node = stack.pop()
+            if _END in node:
+                results.append(word)
+            # Push in reverse so the smallest child is visited first
+            for char in sorted((c for c in node if c != _END), reverse=True):
+                stack.append((word + char, node[char]))
+        return results
+
+_STATIC_INDEXES = {
+    "tools": PrefixIndex(["git", "kubectl"]),
+    "kubectl_subcommands": PrefixIndex(KUBECTL_SUBCOMMANDS),
+    "kubectl_resource_types": PrefixIndex(KUBECTL_RESOURCE_TYPES),
+    "kubectl_flags": PrefixIndex(KUBECTL_FLAGS),
+    "git_subcommands": PrefixIndex(GIT_SUBCOMMANDS),
+    "git_flags": PrefixIndex(GIT_FLAGS)
+}
+
+NAMESPACED_KINDS = ("pods", "deployments", "services")
+
+def _namespaced_names(kind: str, resources: Any) -> Dict[str, Set[str]]:
+    """Split a {namespace: {name: spec}} mapping into one name set per namespace.
+    
+    State updates can't delete keys, so a deleted resource is left behind
+    with a null spec; those are skipped.
+    """
+    names: Dict[str, Set[str]] = {}
+    if isinstance(resources, dict):
+        for namespace, namespace_resources in resources.items():
+            if isinstance(namespace_resources, dict):
+                names[f"{kind}:{namespace}"] = {
+                    name for name, spec in namespace_resources.items() if spec is not None
+                }
+    return names
+
+def extract_resource_names(environment_state: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """Live, completable resource names in a session's environment state.
+    
+    Namespaced resources are keyed "<kind>:<namespace>", e.g. "pods:default".
+    """
+    files: Set[str] = set()
+    for key in ("modified_files", "untracked_files", "staged_files", "conflicted_files"):
+        files.update(f for f in environment_state.get(key) or [] if isinstance(f, str))
+    names = {
+        "namespaces": {n for n in environment_state.get("namespaces") or [] if isinstance(n, str)},
+        "branches": {b for b in environment_state.get("branches") or [] if isinstance(b, str)},
+        "files": files
+    }
+    for kind in NAMESPACED_KINDS:
+        names.update(_namespaced_names(kind, environment_state.get(kind)))
+    return names
+
+class SessionCompletionIndex:
+    """Prefix indexes over one session's live resources, kept in sync by diffing state updates"""
+    
+    def __init__(self, environment_state: Dict[str, Any]):
+        self._names: Dict[str, Set[str]] = {}
+        self._indexes: Dict[str, PrefixIndex] = {}
+        self.current_namespace = "default"
+        self.update(environment_state)
+    
+    def update(self, environment_state: Dict[str, Any]) -> None:
+        """Apply only the added and removed names since the last update"""
+        self.current_namespace = environment_state.get("current_namespace") or "default"
+        current = extract_resource_names(environment_state)
+        # A namespace that disappeared from the state takes its names with it
+        for kind in set(self._names) | set(current):
+            names = current.get(kind, set())
+            index = self._indexes.setdefault(kind, PrefixIndex())
+            previous = self._names.get(kind, set())
+            for name in previous - names:
+                index.remove(name)
+            for name in names - previous:
+                index.insert(name)
+            self._names[kind] = names
+    
+    def _complete_namespaced(self, kind: str, args: List[str], current: str, limit: int) -> List[str]:
+        """Complete names of a namespaced kind from the namespace the command targets"""
+        if "-A" in args or "--all-namespaces" in args:
+            names = {
+                name
+                for key, index in self._indexes.items() if key.startswith(f"{kind}:")
+                for name in index.complete(current, limit)
+            }
+            return sorted(names)[:limit]
+        
+        namespace = namespace_flag(args) or self.current_namespace
+        index = self._indexes.get(f"{kind}:{namespace}")
+        return index.complete(current, limit) if index is not None else []
+    
+    def complete(self, line: str, limit: int = 20) -> List[str]:
+        """Complete the last token of a partially typed command line"""
+        tokens = line.split()
+        if not line or line[-1].isspace():
+            tokens.append("")
+        current, previous = tokens[-1], tokens[:-1]
+        
+        if not previous:
+            return _STATIC_INDEXES["tools"].complete(current, limit)
+        
+        tool = previous[0]
+        if tool in ("kubectl", "k"):
+            return self._complete_kubectl(previous[1:], current, limit)
+        if tool == "git":
+            return self._complete_git(previous[1:], current, limit)
+        return []
+    
+    def _complete_kubectl(self, args: List[str], current: str, limit: int) -> List[str]:
+        if args and args[-1] in ("-n", "--namespace"):
+            return self._indexes["namespaces"].complete(current, limit)
+        if current.startswith("-"):
+            return _STATIC_INDEXES["kubectl_flags"].complete(current, limit)
+        
+        positional = positional_args(args, KUBECTL_VALUE_FLAGS)
+        if not positional:
+            return _STATIC_INDEXES["kubectl_subcommands"].complete(current, limit)
+        
+        subcommand = positional[0]
+        if subcommand in KUBECTL_POD_SUBCOMMANDS:
+            return self._complete_namespaced("pods", args, current, limit)
+        if len(positional) == 1:
+            return _STATIC_INDEXES["kubectl_resource_types"].complete(current, limit)
+        
+        kind = KUBECTL_RESOURCE_ALIASES.get(positional[1])
+        if kind in NAMESPACED_KINDS:
+            return self._complete_namespaced(kind, args, current, limit)
+        return self._indexes[kind].complete(current, limit) if kind else []
+    
+    def _complete_git(self, args: List[str], current: str, limit: int) -> List[str]:
+        if current.startswith("-"):
+            return _STATIC_INDEXES["git_flags"].complete(current, limit)
+        
+        positional = positional_args(args, GIT_VALUE_FLAGS)
+        if not positional:
+            return _STATIC_INDEXES["git_subcommands"].complete(current, limit)
+        
+        subcommand = positional[0]
+        if subcommand in GIT_BRANCH_SUBCOMMANDS:
+            return self._indexes["branches"].complete(current, limit)
+        if subcommand in GIT_FILE_SUBCOMMANDS:
+            return self._indexes["files"].complete(current, limit)
+        return []
@@ -0,0 +1,207 @@
+from typing import Dict, List, Any
+import orjson
+
+# Lab scenario templates. Each template is serialized once at import time and
+# new sessions clone it with orjson.loads, which is much cheaper than deepcopy.
+
+# Default kubernetes environment state
+DEFAULT_K8S_STATE = {
+    "current_namespace": "default",
+    "namespaces": ["default", "kube-system"],
+    "pods": {
+        "default": {
+            "nginx-pod": {
+                "status": "Running",
+                "ip": "10.0.0.2",
+                "containers": ["nginx"],
+                "labels": {"app": "nginx"}
+            }
+        }
+    },
+    "deployments": {
+        "default": {
+            "nginx-deployment": {
+                "replicas": 3,
+                "available": 3,
+                "containers": ["nginx:1.19"],
+                "labels": {"app": "nginx"}
+            }
+        }
+    },
+    "services": {
+        "default": {
+            "nginx-service": {
+                "type": "ClusterIP",
+                "ports": [{"port": 80, "targetPort": 80}],
+                "selector": {"app": "nginx"},
+                "clusterIP": "10.96.0.1"
+            }
+        }
+    }
+}
+
+# Default git environment state
+DEFAULT_GIT_STATE = {
+    "initialized": False,
+    "current_branch": None,
+    "branches": [],
+    "commits": [],
+    "staged_files": [],
+    "modified_files": ["README.md", "app.py"],
+    "untracked_files": ["data.json", "config.yml"]
+}
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "default": {
+        "description": "Healthy nginx deployment and an uninitialized git working directory",
+        "state": {**DEFAULT_K8S_STATE, **DEFAULT_GIT_STATE}
+    },
+    "broken-deployment": {
+        "description": "A deployment stuck on a bad image tag and a crash-looping pod to debug",
+        "state": {
+            **DEFAULT_GIT_STATE,
+            "current_namespace": "default",
+            "namespaces": ["default", "kube-system"],
+            "pods": {
+                "default": {
+                    "web-7d9f8b6c5-x2kqp": {
+                        "status": "ImagePullBackOff",
+                        "ip": None,
+                        "containers": ["web"],
+                        "labels": {"app": "web"},
+                        "events": ["Failed to pull image \"web:1.2.O\": not found"]
+                    },
+                    "api-5c6d7e8f9-q4wzn": {
+                        "status": "CrashLoopBackOff",
+                        "ip": "10.0.0.5",
+                        "containers": ["api"],
+                        "labels": {"app": "api"},
+                        "restarts": 7,
+                        "logs": ["Error: environment variable DATABASE_URL is not set"]
+                    }
+                }
+            },
+            "deployments": {
+                "default": {
+                    "web": {
+                        "replicas": 2,
+                        "available": 0,
+                        "containers": ["web:1.2.O"],
+                        "labels": {"app": "web"}
+                    },
+                    "api": {
+                        "replicas": 1,
+                        "available": 0,
+                        "containers": ["api:2.0.1"],
+                        "labels": {"app": "api"}
+                    }
+                }
+            },
+            "services": {
+                "default": {
+                    "web": {
+                        "type": "ClusterIP",
+                        "ports": [{"port": 80, "targetPort": 8080}],
+                        "selector": {"app": "web"},
+                        "clusterIP": "10.96.0.10"
+                    }
+                }
+            }
+        }
+    },
+    "multi-namespace": {
+        "description": "A cluster split into dev, staging and prod namespaces",
+        "state": {
+            **DEFAULT_GIT_STATE,
+            "current_namespace": "dev",
+            "namespaces": ["default", "kube-system", "dev", "staging", "prod"],
+            "pods": {
+                namespace: {
+                    f"shop-{namespace}-{i}": {
+                        "status": "Running",
+                        "ip": f"10.0.{n}.{i + 2}",
+                        "containers": ["shop"],
+                        "labels": {"app": "shop", "env": namespace}
+                    }
+                    for i in range(replicas)
+                }
+                for n, (namespace, replicas) in enumerate([("dev", 1), ("staging", 2), ("prod", 3)], start=1)
+            },
+            "deployments": {
+                namespace: {
+                    "shop": {
+                        "replicas": replicas,
+                        "available": replicas,
+                        "containers": [f"shop:{version}"],
+                        "labels": {"app": "shop", "env": namespace}
+                    }
+                }
+                for namespace, replicas, version in [("dev", 1, "1.4.0-rc1"), ("staging", 2, "1.3.2"), ("prod", 3, "1.3.1")]
+            },
+            "services": {
+                namespace: {
+                    "shop": {
+                        "type": "LoadBalancer" if namespace == "prod" else "ClusterIP",
+                        "ports": [{"port": 80, "targetPort": 8080}],
+                        "selector": {"app": "shop", "env": namespace},
+                        "clusterIP": f"10.96.{n}.1"
+                    }
+                }
+                for n, namespace in enumerate(["dev", "staging", "prod"], start=1)
+            }
+        }
+    },
+    "feature-branch": {
+        "description": "An initialized repository with a feature branch ready to merge",
+        "state": {
+            **DEFAULT_K8S_STATE,
+            "initialized": True,
+            "current_branch": "feature/login",
+            "branches": ["main", "feature/login"],
+            "commits": [
+                {"hash": "a1b2c3d", "branch": "main", "message": "Initial commit"},
+                {"hash": "e4f5a6b", "branch": "feature/login", "message": "Add login form"},
+                {"hash": "c7d8e9f", "branch": "feature/login", "message": "Validate login input"}
+            ],
+            "staged_files": [],
+            "modified_files": [],
+            "untracked_files": []
+        }
+    },
+    "merge-conflict": {
+        "description": "A merge of feature/header into main that stopped on a conflict",
+        "state": {
+            **DEFAULT_K8S_STATE,
+            "initialized": True,
+            "current_branch": "main",
+            "branches": ["main", "feature/header"],
+            "commits": [
+                {"hash": "1a2b3c4", "branch": "main", "message": "Initial commit"},
+                {"hash": "5d6e7f8", "branch": "main", "message": "Change header title to 'Welcome'"},
+                {"hash": "9a0b1c2", "branch": "feature/header", "message": "Change header title to 'Hello'"}
+            ],
+            "merge_in_progress": {"from": "feature/header", "into": "main"},
+            "conflicted_files": ["index.html"],
+            "staged_files": ["styles.css"],
+            "modified_files": [],
+            "untracked_files": []
+        }
+    }
+}
+
+_SERIALIZED_STATES: Dict[str, bytes] = {
+    name: orjson.dumps(scenario["state"]) for name, scenario in SCENARIOS.items()
+}
+
+def list_scenarios() -> List[Dict[str, str]]:
+    """Names and descriptions of the available scenario templates"""
+    return [
+        {"id": name, "description": scenario["description"]}
+        for name, scenario in SCENARIOS.items()
+    ]
+
+def clone_scenario_state(name: str) -> Dict[str, Any]:
+    """Return a fresh, independent copy of a scenario's environment state"""
+    if name not in _SERIALIZED_STATES:
+        raise ValueError(f"Unknown scenario: {name}")
+    return orjson.loads(_SERIALIZED_STATES[name])
@@ -0,0 +1,273 @@
+from typing import Any, Dict, List, Optional
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import orjson
+
+from app.models.terminal import TerminalSession
+
+# Append-only journal of terminal session changes so sessions survive a worker
+# restart. Records are JSON lines; every record sets whole values (a session or
+# top-level environment keys), so replaying a record twice is harmless. That
+# keeps compaction simple: write a snapshot, then start a fresh journal.
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_FILE = "journal.log"
+
+class SessionJournal:
+    """Group-committing journal writer with periodic snapshot compaction.
+    
+    append() only queues a record; a background thread writes and fsyncs
+    everything queued since its last pass, so many commands share one fsync.
+    At most `fsync_interval` seconds of acknowledged commands can be lost on
+    a crash. If a write or fsync fails (disk full, I/O error) the writer
+    stops, later records are dropped rather than queued, and the error is
+    reported by get_metrics().
+    """
+    
+    def __init__(self,
+                 directory: str,
+                 fsync_interval: float = 0.05,
+                 compact_every: int = 10000):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        os.makedirs(directory, exist_ok=True)
+        
+        self._snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self._journal_path = os.path.join(directory, JOURNAL_FILE)
+        
+        self._lock = threading.Condition()
+        self._pending: List[Any] = []
+        self._closed = False
+        self._file = None
+        self._writer: Optional[threading.Thread] = None
+        # Set to the error that stopped the writer; nothing is journaled after that
+        self.failure: Optional[str] = None
+        
+        self.records_since_snapshot = 0
+        self.stats = {
+            "records": 0,
+            "record_bytes": 0,
+            "journal_bytes_written": 0,
+            "snapshot_bytes_written": 0,
+            "fsyncs": 0,
+            "snapshots": 0,
+            "lost_records": 0,
+            "recovered_sessions": 0,
+            "recovered_records": 0,
+            "recovery_seconds": 0.0
+        }
+    
+    def recover(self) -> Dict[str, TerminalSession]:
+        """Rebuild sessions from the latest snapshot plus the journal, then start the writer"""
+        start = time.monotonic()
+        sessions: Dict[str, TerminalSession] = {}
+        
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, "rb") as f:
+                for data in orjson.loads(f.read())["sessions"]:
+                    session = TerminalSession.model_validate(data)
+                    sessions[session.session_id] = session
+        
+        replayed = 0
+        if os.path.exists(self._journal_path):
+            valid_bytes = 0
+            with open(self._journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("missing newline")
+                        record = orjson.loads(line)
+                    except ValueError:
+                        # A torn final write from a crash; everything before it is intact
+                        logger.warning("Ignoring truncated journal record")
+                        break
+                    self._apply(sessions, record)
+                    replayed += 1
+                    valid_bytes += len(line)
+            # Drop the torn tail so new records don't get appended to it
+            if valid_bytes < os.path.getsize(self._journal_path):
+                os.truncate(self._journal_path, valid_bytes)
+        
+        self.records_since_snapshot = replayed
+        self.stats["recovered_sessions"] = len(sessions)
+        self.stats["recovered_records"] = replayed
+        self.stats["recovery_seconds"] = time.monotonic() - start
+        
+        self._file = open(self._journal_path, "ab")
+        self._writer = threading.Thread(target=self._run, name="session-journal", daemon=True)
+        self._writer.start()
+        return sessions
+    
+    def _apply(self, sessions: Dict[str, TerminalSession], record: Dict[str, Any]) -> None:
+        if record["type"] == "session":
+            session = TerminalSession.model_validate(record["session"])
+            sessions[session.session_id] = session
+        elif record["type"] == "delete":
+            sessions.pop(record["session_id"], None)
+        elif record["type"] == "command":
+            session = sessions.get(record["session_id"])
+            if session is not None:
+                session.environment_state = {**session.environment_state, **record["delta"]}
+                session.updated_at = datetime.fromisoformat(record["updated_at"])
+    
+    def record_session(self, session: TerminalSession) -> None:
+        """Journal a whole session (on create or reset)"""
+        self.append({"type": "session", "session": session.model_dump(mode="json")})
+    
+    def record_delete(self, session_id: str) -> None:
+        """Journal that a session left this worker"""
+        self.append({"type": "delete", "session_id": session_id})
+    
+    def record_command(self,
+                       session: TerminalSession,
+                       command: str,
+                       output: str,
+                       delta: Dict[str, Any]) -> None:
+        """Journal a command and the top-level environment keys it changed"""
+        self.append({
+            "type": "command",
+            "session_id": session.session_id,
+            "command": command,
+            "output": output,
+            "delta": delta,
+            "updated_at": session.updated_at
+        })
+    
+    def append(self, record: Dict[str, Any]) -> None:
+        line = orjson.dumps(record) + b"\n"
+        with self._lock:
+            if self.failure is not None:
+                self.stats["lost_records"] += 1
+                return
+            self._pending.append(line)
+            self._lock.notify()
+        self.records_since_snapshot += 1
+        self.stats["records"] += 1
+        self.stats["record_bytes"] += len(line)
+    
+    def needs_compaction(self) -> bool:
+        return self.records_since_snapshot >= self.compact_every
+    
+    def compact(self, sessions: Dict[str, TerminalSession]) -> None:
+        """Queue a snapshot of all sessions; the writer then starts a new, empty journal"""
+        snapshot = orjson.dumps({"sessions": [s.model_dump(mode="json") for s in sessions.values()]})
+        with self._lock:
+            if self.failure is not None:
+                return
+            self._pending.append(_Snapshot(snapshot))
+            self._lock.notify()
+        self.records_since_snapshot = 0
+    
+    def close(self) -> None:
+        """Flush and fsync everything queued, then stop the writer"""
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        if self._writer is not None:
+            self._writer.join()
+    
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._lock.wait()
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    self._fail(e, batch)
+                    return
+            if closed:
+                self._file.close()
+                return
+            # Let records accumulate so the next fsync covers a whole group
+            time.sleep(self.fsync_interval)
+    
+    def _fail(self, error: Exception, batch: List[Any]) -> None:
+        """Stop journaling after a write error; the batch may be partly written and is counted as lost"""
+        logger.exception("Session journal write failed, journaling stopped")
+        with self._lock:
+            self.failure = f"{type(error).__name__}: {error}"
+            lost = [item for item in batch + self._pending if not isinstance(item, _Snapshot)]
+            self.stats["lost_records"] += len(lost)
+            self._pending = []
+        try:
+            self._file.close()
+        except OSError:
+            pass
+    
+    def _write_batch(self, batch: List[Any]) -> None:
+        lines: List[bytes] = []
+        for item in batch:
+            if isinstance(item, _Snapshot):
+                self._flush(lines)
+                lines = []
+                self._write_snapshot(item.data)
+            else:
+                lines.append(item)
+        self._flush(lines)
+    
+    def _flush(self, lines: List[bytes]) -> None:
+        if not lines:
+            return
+        data = b"".join(lines)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.stats["journal_bytes_written"] += len(data)
+        self.stats["fsyncs"] += 1
+    
+    def _write_snapshot(self, data: bytes) -> None:
+        # Everything journaled so far is covered by the snapshot once it is in place
+        tmp_path = self._snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path)
+        _fsync_directory(self.directory)
+        
+        self._file.close()
+        self._file = open(self._journal_path, "wb")
+        os.fsync(self._file.fileno())
+        
+        self.stats["snapshot_bytes_written"] += len(data)
+        self.stats["fsyncs"] += 3
+        self.stats["snapshots"] += 1
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["failure"] = self.failure
+        written = stats["journal_bytes_written"] + stats["snapshot_bytes_written"]
+        stats["write_amplification"] = written / stats["record_bytes"] if stats["record_bytes"] else None
+        stats["records_per_fsync"] = stats["records"] / stats["fsyncs"] if stats["fsyncs"] else None
+        return stats
+
+class _Snapshot:
+    """Queue marker carrying a serialized snapshot"""
+    
+    def __init__(self, data: bytes):
+        self.data = data
+
+def _fsync_directory(directory: str) -> None:
+    """Persist a rename; not supported on every platform"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
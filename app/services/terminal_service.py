@@ -1,8 +1,13 @@
-from typing import Dict, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple
+import asyncio
+import os
 import uuid
 from datetime import datetime
 
 from app.models.terminal import TerminalRequest, TerminalResponse, TerminalSession
+from app.services.completion import SessionCompletionIndex
+from app.services.scenarios import clone_scenario_state
+from app.services.session_journal import SessionJournal
 from llm.chains.terminal_chains import TerminalSimulationChain
 
 class TerminalService:
@@ -11,79 +16,86 @@ class TerminalService:
         # In production, you would use a database
         self.sessions: Dict[str, TerminalSession] = {}
         
+        # Autocompletion indexes, built on a session's first completion request
+        self.completion_indexes: Dict[str, SessionCompletionIndex] = {}
+        
+        # Commands on one session run one at a time while the LLM call runs off the event loop
+        self.session_locks: Dict[str, asyncio.Lock] = {}
+        
+        # Behind app.launcher the dispatcher picks the IDs of new sessions
+        self.accept_affinity_ids = bool(os.getenv("LEARNCLI_WORKER_ID"))
+        
         # Initialize terminal simulation chain
+        # (cheap: the LLM client and LangChain objects are built on first use)
         self.terminal_chain = TerminalSimulationChain()
         
-        # Default kubernetes environment state
-        self.default_k8s_state = {
-            "current_namespace": "default",
-            "namespaces": ["default", "kube-system"],
-            "pods": {
-                "default": {
-                    "nginx-pod": {
-                        "status": "Running",
-                        "ip": "10.0.0.2",
-                        "containers": ["nginx"],
-                        "labels": {"app": "nginx"}
-                    }
-                }
-            },
-            "deployments": {
-                "default": {
-                    "nginx-deployment": {
-                        "replicas": 3,
-                        "available": 3,
-                        "containers": ["nginx:1.19"],
-                        "labels": {"app": "nginx"}
-                    }
-                }
-            },
-            "services": {
-                "default": {
-                    "nginx-service": {
-                        "type": "ClusterIP",
-                        "ports": [{"port": 80, "targetPort": 80}],
-                        "selector": {"app": "nginx"},
-                        "clusterIP": "10.96.0.1"
-                    }
-                }
-            }
-        }
-        
-        # Default git environment state
-        self.default_git_state = {
-            "initialized": False,
-            "current_branch": None,
-            "branches": [],
-            "commits": [],
-            "staged_files": [],
-            "modified_files": ["README.md", "app.py"],
-            "untracked_files": ["data.json", "config.yml"]
+        # Optional on-disk journal; sessions from before a restart are replayed from it
+        self.journal: Optional[SessionJournal] = None
+        journal_dir = os.getenv("TERMINAL_JOURNAL_DIR")
+        if journal_dir:
+            self.journal = SessionJournal(
+                journal_dir,
+                fsync_interval=float(os.getenv("TERMINAL_JOURNAL_FSYNC_MS", "50")) / 1000,
+                compact_every=int(os.getenv("TERMINAL_JOURNAL_COMPACT_RECORDS", "10000"))
+            )
+            self.sessions = self.journal.recover()
+    
+    def warm_up(self) -> None:
+        """Build the LLM chains ahead of the first terminal command"""
+        self.terminal_chain.warm_up()
+    
+    def close(self) -> None:
+        """Flush the session journal, if enabled"""
+        if self.journal is not None:
+            self.journal.close()
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Metrics from the terminal simulation chain and the session journal"""
+        return {
+            **self.terminal_chain.get_metrics(),
+            "journal": self.journal.get_metrics() if self.journal is not None else None
         }
     
-    async def process_command(self, request: TerminalRequest) -> TerminalResponse:
+    async def process_command(self, request: TerminalRequest, new_session_id: Optional[str] = None) -> TerminalResponse:
         """Process a terminal command and return the output"""
         # Get or create session
         session_id = request.session_id
         if not session_id or session_id not in self.sessions:
-            session_id = str(uuid.uuid4())
-            self.sessions[session_id] = TerminalSession(
-                session_id=session_id,
-                user_id=request.user_id,
-                environment_state=self._create_default_environment()
-            )
+            session_id = (await self.create_session(request.user_id, session_id=new_session_id)).session_id
         
-        session = self.sessions[session_id]
+        async with self._session_lock(session_id):
+            return await self._process_command(request, session_id)
+    
+    async def _process_command(self, request: TerminalRequest, session_id: str) -> TerminalResponse:
+        # The session may have been handed to another worker while this command waited
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = await self.create_session(request.user_id)
+            session_id = session.session_id
         
         # Process the command
-        output, updated_state, parsed_command = self.terminal_chain.process_command(
+        loop = asyncio.get_running_loop()
+        output, updated_state, parsed_command = await loop.run_in_executor(
+            None,
+            self.terminal_chain.process_command,
             request.command,
             session.environment_state
         )
         
         # Update session state
+        previous_state = session.environment_state
         session.environment_state = updated_state
         session.updated_at = datetime.now()
+        self._refresh_completion_index(session)
+        
+        if self.journal is not None:
+            # State updates replace changed top-level values, so an identity check finds them
+            delta = {
+                key: value for key, value in updated_state.items()
+                if previous_state.get(key) is not value
+            }
+            self.journal.record_command(session, request.command, output, delta)
+            self._maybe_compact_journal()
         
         # Create and return response
         return TerminalResponse(
@@ -93,32 +105,100 @@ class TerminalService:
             command_parsed=parsed_command
         )
     
+    async def create_session(self,
+                             user_id: Optional[str] = None,
+                             scenario: str = "default",
+                             session_id: Optional[str] = None) -> TerminalSession:
+        """Create a new session cloned from a scenario template, without calling the LLM"""
+        session_id = self._new_session_id(session_id)
+        session = TerminalSession(
+            session_id=session_id,
+            user_id=user_id,
+            scenario=scenario,
+            environment_state=clone_scenario_state(scenario)
+        )
+        self.sessions[session_id] = session
+        if self.journal is not None:
+            self.journal.record_session(session)
+        return session
+    
     async def get_session(self, session_id: str) -> Optional[TerminalSession]:
         """Get session by ID"""
         return self.sessions.get(session_id)
     
+    async def release_session(self, session_id: str) -> Optional[TerminalSession]:
+        """Remove a session from this worker so another one can adopt it"""
+        # Wait for a command in progress so its state change moves with the session
+        async with self._session_lock(session_id):
+            session = self.sessions.pop(session_id, None)
+        self.session_locks.pop(session_id, None)
+        self.completion_indexes.pop(session_id, None)
+        if session is not None and self.journal is not None:
+            self.journal.record_delete(session_id)
+        return session
+    
+    async def adopt_session(self, session: TerminalSession) -> None:
+        """Take over a session released by another worker"""
+        self.sessions[session.session_id] = session
+        self.completion_indexes.pop(session.session_id, None)
+        if self.journal is not None:
+            self.journal.record_session(session)
+    
     async def reset_session(self, session_id: str) -> bool:
-        """Reset a session to default state"""
+        """Reset a session to the initial state of its scenario"""
         if session_id not in self.sessions:
             return False
-            
-        session = self.sessions[session_id]
-        user_id = session.user_id
         
-        # Create a new session with default state
-        self.sessions[session_id] = TerminalSession(
-            session_id=session_id,
-            user_id=user_id,
-            environment_state=self._create_default_environment()
-        )
+        # Let a command in progress finish first, so it can't write over the reset state
+        async with self._session_lock(session_id):
+            session = self.sessions.get(session_id)
+            if session is None:
+                return False
+            
+            # Create a new session with the scenario's initial state
+            self.sessions[session_id] = TerminalSession(
+                session_id=session_id,
+                user_id=session.user_id,
+                scenario=session.scenario,
+                environment_state=clone_scenario_state(session.scenario)
+            )
+            self._refresh_completion_index(self.sessions[session_id])
+            if self.journal is not None:
+                self.journal.record_session(self.sessions[session_id])
         
         return True
     
-    def _create_default_environment(self) -> Dict[str, Any]:
-        """Create a default environment state with both k8s and git elements"""
-        return {
-            # K8s elements
-            **self.default_k8s_state,
-            # Git elements
-            **self.default_git_state
-        }
\ No newline at end of file
+    async def complete_command(self, session_id: str, prefix: str, limit: int = 20) -> Optional[List[str]]:
+        """Complete a partially typed command from the session's live resources"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        
+        index = self.completion_indexes.get(session_id)
+        if index is None:
+            index = SessionCompletionIndex(session.environment_state)
+            self.completion_indexes[session_id] = index
+        return index.complete(prefix, limit)
+    
+    def _new_session_id(self, requested: Optional[str]) -> str:
+        """Use a dispatcher-chosen ID only in launcher workers, and never one that is taken"""
+        if requested and self.accept_affinity_ids and requested not in self.sessions:
+            return requested
+        return str(uuid.uuid4())
+    
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self.session_locks.get(session_id)
+        if lock is None:
+            lock = self.session_locks[session_id] = asyncio.Lock()
+        return lock
+    
+    def _maybe_compact_journal(self) -> None:
+        """Snapshot all sessions once enough records have accumulated in the journal"""
+        if self.journal.needs_compaction():
+            self.journal.compact(self.sessions)
+    
+    def _refresh_completion_index(self, session: TerminalSession) -> None:
+        """Apply a state change to the session's completion index, if it has one"""
+        index = self.completion_indexes.get(session.session_id)
+        if index is not None:
+            index.update(session.environment_state)
\ No newline at end of file
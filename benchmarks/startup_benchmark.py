@@ -0,0 +1,54 @@
+"""Measure cold import time of app.main and check heavy modules stay unloaded.
+
+Run from the repository root: python -m benchmarks.startup_benchmark
+"""
+import statistics
+import subprocess
+import sys
+
+RUNS = 5
+
+# Modules that should only be imported once a chain is actually used
+HEAVY_MODULES = ["langchain", "langchain_openai", "openai"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import app.main
+from fastapi.testclient import TestClient
+client = TestClient(app.main.app)
+client.get("/")
+client.get("/chat/topics")
+elapsed = time.perf_counter() - start
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def run_once() -> tuple:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    elapsed, _, loaded = result.stdout.strip().partition(" ")
+    return float(elapsed), [m for m in loaded.split(",") if m]
+
+
+def main() -> None:
+    timings = []
+    loaded = []
+    for _ in range(RUNS):
+        elapsed, loaded = run_once()
+        timings.append(elapsed)
+    
+    print(f"import app.main + serve / and /chat/topics over {RUNS} cold runs")
+    print(f"  median: {statistics.median(timings) * 1000:.1f} ms")
+    print(f"  min:    {min(timings) * 1000:.1f} ms")
+    print(f"  max:    {max(timings) * 1000:.1f} ms")
+    print(f"  heavy modules loaded: {', '.join(loaded) if loaded else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from typing import Dict, List, Optional, Tuple
+import re
+import threading
+import zlib
+
+import numpy as np
+
+# Local near-duplicate answer cache for teacher responses. Questions are
+# embedded as hashed word and character n-gram vectors, so lookups are a
+# single matrix-vector product and no embedding model or network call is needed.
+
+_NORMALIZE_RE = re.compile(r"[^a-z0-9 ]+")
+
+# Words that can differ between two phrasings of the same question
+FILLER_WORDS = frozenset({
+    "a", "an", "the", "is", "are", "s", "do", "does", "i", "me", "my",
+    "to", "of", "please", "can", "could", "would", "you", "explain", "tell", "about"
+})
+
+def _content_text(text: str) -> str:
+    """Lowercased question with punctuation and filler words removed"""
+    return " ".join(w for w in _NORMALIZE_RE.sub(" ", text.lower()).split() if w not in FILLER_WORDS)
+
+def content_words(text: str) -> frozenset:
+    """Words of a question that change what is being asked"""
+    return frozenset(_content_text(text).split())
+
+# Endings that turn one word into another form of it ("stash" -> "stashes")
+INFLECTION_SUFFIXES = ("s", "es", "d", "ed", "ing")
+
+def _same_question(a: frozenset, b: frozenset) -> bool:
+    """Every word only one side has must be an inflection ("stash"/"stashes") of a word on the other side"""
+    def inflected(word: str, others: frozenset) -> bool:
+        for other in others:
+            short, long = sorted((word, other), key=len)
+            if len(short) >= 4 and long.startswith(short) and long[len(short):] in INFLECTION_SUFFIXES:
+                return True
+        return False
+    return all(inflected(w, b) for w in a - b) and all(inflected(w, a) for w in b - a)
+
+def embed(text: str, dim: int) -> np.ndarray:
+    """L2-normalized hashed bag of word unigrams and character trigrams"""
+    text = _content_text(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    features = text.split()
+    padded = f" {text} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for feature in features:
+        vector[zlib.crc32(feature.encode("utf-8")) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class _Bucket:
+    """Fixed-capacity vector store for one (topic, experience level) pair"""
+    
+    def __init__(self, dim: int, capacity: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.answers: List[Optional[str]] = [None] * capacity
+        self.words: List[frozenset] = [frozenset()] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        # Chat messages are answered in executor threads; an entry is written in several steps
+        self.lock = threading.Lock()
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.92, max_entries: int = 512, dim: int = 1024):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        # Guards the bucket map, the tick and the counters; taken after a bucket lock, never before
+        self._lock = threading.Lock()
+        self._tick = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _next_tick(self) -> int:
+        with self._lock:
+            self._tick += 1
+            return self._tick
+    
+    def lookup(self, topic: str, experience_level: str, question: str) -> Optional[str]:
+        """Return a cached answer to a near-duplicate question, if any"""
+        vector = embed(question, self.dim)
+        words = content_words(question)
+        
+        answer = None
+        bucket = self._buckets.get((topic, experience_level))
+        if bucket is not None:
+            with bucket.lock:
+                similarities = bucket.vectors[:bucket.size] @ vector
+                candidates = np.flatnonzero(similarities >= self.threshold)
+                # Similar n-grams aren't enough: "git stash" and "git stash pop" are different questions
+                best = next(
+                    (
+                        int(i) for i in candidates[np.argsort(-similarities[candidates])]
+                        if _same_question(bucket.words[i], words)
+                    ),
+                    None
+                )
+                if best is not None:
+                    bucket.last_used[best] = self._next_tick()
+                    answer = bucket.answers[best]
+        
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+    
+    def store(self, topic: str, experience_level: str, question: str, answer: str) -> None:
+        """Cache an answer, evicting the least recently used entry when full"""
+        vector = embed(question, self.dim)
+        words = content_words(question)
+        
+        with self._lock:
+            bucket = self._buckets.get((topic, experience_level))
+            if bucket is None:
+                bucket = self._buckets[(topic, experience_level)] = _Bucket(self.dim, self.max_entries)
+        
+        with bucket.lock:
+            evicted = bucket.size >= self.max_entries
+            if evicted:
+                slot = int(np.argmin(bucket.last_used))
+            else:
+                slot = bucket.size
+                bucket.size += 1
+            
+            bucket.vectors[slot] = vector
+            bucket.answers[slot] = answer
+            bucket.words[slot] = words
+            bucket.last_used[slot] = self._next_tick()
+        
+        if evicted:
+            with self._lock:
+                self.evictions += 1
+    
+    def get_stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(bucket.size for bucket in self._buckets.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "threshold": self.threshold
+        }
@@ -0,0 +1,139 @@
+from typing import Any, Dict, Optional
+import os
+
+from llm.cli_tokens import GIT_VALUE_FLAGS, KUBECTL_VALUE_FLAGS, namespace_flag, positional_args, tokenize
+
+# Local consistency checks used by the terminal model cascade. A small model's
+# output and state delta are accepted only if they agree with the session
+# state; anything suspicious is escalated to the large model.
+
+# Phrases that show the model answered as an assistant instead of a terminal
+ASSISTANT_MARKERS = ("```", "as an ai", "here is", "here's the", "i cannot", "i'm sorry", "sure,")
+# Phrases that show the simulated command failed
+ERROR_MARKERS = ("error", "not found", "fatal:", "unknown command", "invalid", "usage:")
+
+KUBECTL_READ_ONLY = {"get", "describe", "logs", "top", "explain", "version", "api-resources", "cluster-info"}
+KUBECTL_MUTATING = {
+    "apply", "create", "delete", "run", "expose", "scale", "set", "label",
+    "annotate", "patch", "edit", "rollout", "replace"
+}
+GIT_READ_ONLY = {"status", "log", "diff", "show", "blame", "shortlog", "describe"}
+GIT_MUTATING = {
+    "init", "add", "commit", "checkout", "switch", "branch", "merge", "rebase",
+    "reset", "rm", "mv", "restore", "stash", "tag", "cherry-pick", "revert", "clone"
+}
+GIT_WITHOUT_REPO = {"init", "clone", "version", "help", "config"}
+
+KUBECTL_RESOURCE_KEYS = {
+    "po": "pods", "pod": "pods", "pods": "pods",
+    "deploy": "deployments", "deployment": "deployments", "deployments": "deployments",
+    "svc": "services", "service": "services", "services": "services"
+}
+
+# Keys a state delta may introduce even if the session state doesn't have them yet
+ALLOWED_NEW_STATE_KEYS = (
+    "current_namespace", "namespaces", "pods", "deployments", "services",
+    "initialized", "current_branch", "branches", "commits", "staged_files",
+    "modified_files", "untracked_files", "conflicted_files", "merge_in_progress",
+    "configmaps", "secrets", "remotes", "stash", "tags"
+)
+
+def _looks_like_error(output: str) -> bool:
+    lowered = output.lower()
+    return any(marker in lowered for marker in ERROR_MARKERS)
+
+def check_simulation(command: str,
+                     command_type: str,
+                     output: str,
+                     state_updates: Optional[Dict[str, Any]],
+                     environment_state: Dict[str, Any]) -> Optional[str]:
+    """Return why a simulated output/state delta looks inconsistent, or None if it can be accepted"""
+    stripped = output.strip()
+    if not stripped:
+        return "empty_output"
+    if any(marker in stripped.lower() for marker in ASSISTANT_MARKERS):
+        return "assistant_prose"
+    if state_updates is None:
+        return "unparseable_state_delta"
+    
+    unknown_keys = set(state_updates) - set(environment_state) - set(ALLOWED_NEW_STATE_KEYS)
+    if unknown_keys:
+        return "unknown_state_keys"
+    
+    tokens = tokenize(command)
+    value_flags = KUBECTL_VALUE_FLAGS if command_type == "kubectl" else GIT_VALUE_FLAGS
+    # Subcommand first, then its arguments; global flags may come before the subcommand
+    positional = positional_args(tokens[1:], value_flags)
+    subcommand = positional[0] if positional else None
+    failed = _looks_like_error(stripped)
+    
+    if command_type == "kubectl":
+        if subcommand in KUBECTL_READ_ONLY and state_updates:
+            return "read_only_command_changed_state"
+        if subcommand in KUBECTL_MUTATING and not failed and not state_updates:
+            return "mutating_command_without_state_change"
+        
+        # `kubectl get/describe/delete <type> <name>` must agree with the known resources
+        if subcommand in ("get", "describe", "delete") and len(positional) >= 3:
+            kind = KUBECTL_RESOURCE_KEYS.get(positional[1])
+            if kind:
+                namespace = namespace_flag(tokens) or environment_state.get("current_namespace") or "default"
+                known = (environment_state.get(kind) or {}).get(namespace) or {}
+                exists = positional[2] in known
+                if exists and "notfound" in stripped.lower().replace(" ", ""):
+                    return "existing_resource_reported_missing"
+                if not exists and not failed:
+                    return "unknown_resource_reported_present"
+    
+    elif command_type == "git":
+        if not environment_state.get("initialized") and subcommand not in GIT_WITHOUT_REPO and not failed:
+            return "git_command_outside_repository"
+        if subcommand in GIT_READ_ONLY and state_updates:
+            return "read_only_command_changed_state"
+        if subcommand in GIT_MUTATING and not failed and not state_updates:
+            return "mutating_command_without_state_change"
+    
+    return None
+
+class CascadeStats:
+    """Escalation rate and the latency/cost saved by answering with the small model"""
+    
+    def __init__(self, small_relative_cost: Optional[float] = None):
+        # Cost of one small-model call relative to one large-model call
+        if small_relative_cost is None:
+            small_relative_cost = float(os.getenv("TERMINAL_SMALL_MODEL_RELATIVE_COST", "0.05"))
+        self.small_relative_cost = small_relative_cost
+        self.commands = 0
+        self.escalations = 0
+        self.reasons: Dict[str, int] = {}
+        self.small_seconds = 0.0
+        self.large_seconds = 0.0
+    
+    def record(self, small_seconds: float, escalation_reason: Optional[str], large_seconds: float = 0.0) -> None:
+        self.commands += 1
+        self.small_seconds += small_seconds
+        if escalation_reason is None:
+            return
+        self.escalations += 1
+        self.large_seconds += large_seconds
+        self.reasons[escalation_reason] = self.reasons.get(escalation_reason, 0) + 1
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        # Large-model latency is only observed on escalations; use its mean as the baseline
+        mean_large = self.large_seconds / self.escalations if self.escalations else None
+        latency_saved = (
+            mean_large * self.commands - self.small_seconds - self.large_seconds
+            if mean_large is not None else None
+        )
+        spent = self.commands * self.small_relative_cost + self.escalations
+        return {
+            "commands": self.commands,
+            "escalations": self.escalations,
+            "escalation_rate": self.escalations / self.commands if self.commands else 0.0,
+            "escalation_reasons": self.reasons,
+            "mean_small_seconds": self.small_seconds / self.commands if self.commands else None,
+            "mean_large_seconds": mean_large,
+            "estimated_latency_saved_seconds": latency_saved,
+            "relative_cost": spent / self.commands if self.commands else None,
+            "estimated_cost_saved_large_calls": self.commands - spent
+        }
@@ -1,48 +1,96 @@
-from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import ChatOpenAI
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
 import json
+import logging
 import os
 
-from llm.prompts.chat_prompts import (
-    KUBERNETES_TEACHER_PROMPT, 
-    GIT_TEACHER_PROMPT,
-    TOPIC_INTRODUCTION_PROMPT,
-    LEARNING_ASSESSMENT_PROMPT
-)
+from llm.resilience import LLMUnavailableError, ResilientInvoker, get_default_invoker
+
+if TYPE_CHECKING:
+    from llm.answer_cache import SemanticAnswerCache
+
+# LangChain, the OpenAI client and the prompt templates are imported lazily
+# inside the properties below so that importing this module (and therefore
+# app.main) stays cheap. The heavy objects are built on first use or by warm_up().
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_TOPICS = ("kubernetes", "git")
 
 class ChatLearningChain:
-    def __init__(self, topic: str = "kubernetes"):
-        self.llm = ChatOpenAI(
-            model_name=os.getenv("OPENAI_MODEL_NAME", "gpt-4"),
-            temperature=0.7
-        )
+    def __init__(self,
+                 topic: str = "kubernetes",
+                 answer_cache: Optional["SemanticAnswerCache"] = None,
+                 invoker: Optional[ResilientInvoker] = None):
         self.topic = topic.lower()
-        self.memory = ConversationBufferMemory(
-            memory_key="conversation_history",
-            input_key="user_message"
-        )
-        
-        # Select the appropriate prompt based on topic
-        if self.topic == "kubernetes":
-            self.prompt = KUBERNETES_TEACHER_PROMPT
-        elif self.topic == "git":
-            self.prompt = GIT_TEACHER_PROMPT
-        else:
+        if self.topic not in SUPPORTED_TOPICS:
             raise ValueError(f"Unsupported topic: {topic}")
-            
-        self.chain = LLMChain(
-            llm=self.llm,
-            prompt=self.prompt,
-            memory=self.memory,
-            verbose=True
-        )
+        
+        # Deadlines, retries and circuit breaking for every LLM call
+        self.invoker = invoker or get_default_invoker()
+        
+        # Optional cache of answers to near-duplicate first-turn questions
+        self.answer_cache = answer_cache
+        
+        self._llm = None
+        self._memory = None
+        self._prompt = None
+        self._chain = None
         
         # Track learning progress
         self.experience_level = "beginner"
         self.concepts_covered = []
         self.current_focus = "introduction"
+    
+    @property
+    def llm(self):
+        """Chat model client, created on first use"""
+        if self._llm is None:
+            from langchain_openai import ChatOpenAI
+            self._llm = ChatOpenAI(
+                model_name=os.getenv("OPENAI_MODEL_NAME", "gpt-4"),
+                temperature=0.7,
+                **self.invoker.client_options("chat", "introduction", "assessment")
+            )
+        return self._llm
+    
+    @property
+    def memory(self):
+        """Conversation buffer memory, created on first use"""
+        if self._memory is None:
+            from langchain.memory import ConversationBufferMemory
+            self._memory = ConversationBufferMemory(
+                memory_key="conversation_history",
+                input_key="user_message"
+            )
+        return self._memory
+    
+    @property
+    def prompt(self):
+        """Teacher prompt for this chain's topic"""
+        if self._prompt is None:
+            from llm.prompts.chat_prompts import KUBERNETES_TEACHER_PROMPT, GIT_TEACHER_PROMPT
+            if self.topic == "kubernetes":
+                self._prompt = KUBERNETES_TEACHER_PROMPT
+            else:
+                self._prompt = GIT_TEACHER_PROMPT
+        return self._prompt
+    
+    @property
+    def chain(self):
+        """Teaching LLMChain, created on first use"""
+        if self._chain is None:
+            from langchain.chains import LLMChain
+            self._chain = LLMChain(
+                llm=self.llm,
+                prompt=self.prompt,
+                memory=self.memory,
+                verbose=True
+            )
+        return self._chain
+    
+    def warm_up(self) -> None:
+        """Import dependencies and build the LLM client and chain ahead of the first request"""
+        self.chain
         
     def format_conversation_history(self, messages: List[Dict[str, Any]]) -> str:
         """Format message history for prompt context"""
@@ -72,29 +120,50 @@ class ChatLearningChain:
             "current_focus": self.current_focus
         }
         
-        # Get response from the chain
-        response = self.chain.invoke(inputs)
+        # Only first-turn questions are cacheable, later answers depend on the conversation
+        cacheable = (
+            self.answer_cache is not None
+            and conversation_history is not None
+            and len(conversation_history) <= 1
+        )
+        answer = None
+        if cacheable:
+            answer = self.answer_cache.lookup(self.topic, self.experience_level, user_message)
+        cache_hit = answer is not None
+        
+        if not cache_hit:
+            # Get response from the chain
+            answer = self.invoker.invoke("chat", self.chain, inputs)["text"]
+            if cacheable:
+                self.answer_cache.store(self.topic, self.experience_level, user_message, answer)
         
         # Update the memory if using custom conversation history
         if conversation_history:
             self.memory.chat_memory.add_user_message(user_message)
-            self.memory.chat_memory.add_ai_message(response["text"])
+            self.memory.chat_memory.add_ai_message(answer)
+        
+        # A cached answer must not cost an LLM call, so skip the progress assessment
+        if cache_hit:
+            return answer
             
         # Extract and update learning progress (simplified)
         # In a real implementation, this would use a separate chain to analyze understanding
         if len(self.memory.buffer) > 500:  # Some arbitrary threshold
             self._update_learning_progress()
             
-        return response["text"]
+        return answer
     
     def introduce_topic(self, subtopic: str) -> str:
         """Generate an introduction to a new topic or subtopic"""
+        from langchain.chains import LLMChain
+        from llm.prompts.chat_prompts import TOPIC_INTRODUCTION_PROMPT
+        
         intro_chain = LLMChain(
             llm=self.llm,
             prompt=TOPIC_INTRODUCTION_PROMPT
         )
         
-        response = intro_chain.invoke({
+        response = self.invoker.invoke("introduction", intro_chain, {
             "topic": self.topic,
             "subtopic": subtopic
         })
@@ -107,15 +176,23 @@ class ChatLearningChain:
     
     def _update_learning_progress(self) -> None:
         """Analyze conversation to update user's learning progress"""
+        from langchain.chains import LLMChain
+        from llm.prompts.chat_prompts import LEARNING_ASSESSMENT_PROMPT
+        
         assessment_chain = LLMChain(
             llm=self.llm,
             prompt=LEARNING_ASSESSMENT_PROMPT
         )
         
-        response = assessment_chain.invoke({
-            "topic": self.topic,
-            "conversation_history": self.memory.buffer
-        })
+        try:
+            response = self.invoker.invoke("assessment", assessment_chain, {
+                "topic": self.topic,
+                "conversation_history": self.memory.buffer
+            })
+        except LLMUnavailableError as e:
+            # Progress tracking is best effort and must not fail the user's message
+            logger.warning("Skipping learning assessment: %s", e)
+            return
         
         # This would ideally parse the response to update learning progress
         # For now, we just increment the experience level after some interactions
@@ -1,48 +1,167 @@
-from langchain.chains import LLMChain
-from langchain_openai import ChatOpenAI
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, Type
 import json
+import logging
 import os
 import re
+import time
 
-from llm.prompts.terminal_prompts import (
-    KUBERNETES_CLI_PROMPT,
-    GIT_CLI_PROMPT,
-    COMMAND_PARSER_PROMPT,
-    STATE_UPDATE_PROMPT
-)
+from pydantic import BaseModel
+
+from llm.cascade import CascadeStats, check_simulation
+from llm.resilience import LLMUnavailableError, ResilientInvoker, get_default_invoker
+from llm.structured_output import ParsedCommand, StateDelta, parse_structured, schema_description
+
+logger = logging.getLogger(__name__)
+
+# Returned instead of a simulated output while the LLM is failing or the breaker is open
+SIMULATOR_UNAVAILABLE_OUTPUT = "Error: the terminal simulator is temporarily unavailable. Please try again in a moment."
+
+# LangChain, the OpenAI client and the prompt templates are imported lazily
+# so that importing this module (and therefore app.main) stays cheap. Each
+# chain is built on first use or by warm_up().
+
+# Model used for each tier; "small" is only used in cascade mode
+MODEL_NAMES = {
+    "large": os.getenv("OPENAI_MODEL_NAME", "gpt-4"),
+    "small": os.getenv("OPENAI_SMALL_MODEL_NAME", "gpt-3.5-turbo")
+}
 
 class TerminalSimulationChain:
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model_name=os.getenv("OPENAI_MODEL_NAME", "gpt-4"),
-            temperature=0.1  # Lower temperature for more consistent outputs
-        )
+    def __init__(self, invoker: Optional[ResilientInvoker] = None, cascade: Optional[bool] = None):
+        # Deadlines, retries, hedging and circuit breaking for every LLM call
+        self.invoker = invoker or get_default_invoker()
+        self._llms: Dict[str, Any] = {}
+        self._chains: Dict[Tuple[str, str], Any] = {}
         
-        # Initialize the chains
-        self.k8s_chain = LLMChain(
-            llm=self.llm,
-            prompt=KUBERNETES_CLI_PROMPT,
-            verbose=True
-        )
+        # Cascade mode: simulate with the small model first and escalate to the
+        # large one only when the result is inconsistent with the session state
+        if cascade is None:
+            cascade = os.getenv("TERMINAL_CASCADE", "false").lower() in ("1", "true", "yes")
+        self.cascade = cascade
+        self.cascade_stats = CascadeStats()
         
-        self.git_chain = LLMChain(
-            llm=self.llm,
-            prompt=GIT_CLI_PROMPT,
-            verbose=True
-        )
+        # Structured output counters per role, see get_metrics()
+        self.output_stats: Dict[str, Dict[str, int]] = {
+            role: {"calls": 0, "clean": 0, "repaired": 0, "reasked": 0, "reask_recovered": 0, "wasted": 0}
+            for role in ("parser", "state_update")
+        }
+    
+    def _get_llm(self, tier: str):
+        """Chat model client for a tier, created on first use"""
+        llm = self._llms.get(tier)
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+            llm = ChatOpenAI(
+                model_name=MODEL_NAMES[tier],
+                temperature=0.1,  # Lower temperature for more consistent outputs
+                **self.invoker.client_options("parser", f"simulation_{tier}", f"state_update_{tier}", "json_repair")
+            )
+            self._llms[tier] = llm
+        return llm
+    
+    @property
+    def llm(self):
+        return self._get_llm("large")
+    
+    def _get_chain(self, prompt_name: str, tier: str = "large"):
+        """Build (once) and return the LLMChain for a prompt in llm.prompts.terminal_prompts"""
+        chain = self._chains.get((prompt_name, tier))
+        if chain is None:
+            from langchain.chains import LLMChain
+            from llm.prompts import terminal_prompts
+            
+            chain = LLMChain(
+                llm=self._get_llm(tier),
+                prompt=getattr(terminal_prompts, prompt_name),
+                verbose=True
+            )
+            self._chains[(prompt_name, tier)] = chain
+        return chain
+    
+    @property
+    def k8s_chain(self):
+        return self._get_chain("KUBERNETES_CLI_PROMPT")
+    
+    @property
+    def git_chain(self):
+        return self._get_chain("GIT_CLI_PROMPT")
+    
+    @property
+    def parser_chain(self):
+        # Parsing is simple enough for the small model whenever the cascade is on
+        return self._get_chain("COMMAND_PARSER_PROMPT", "small" if self.cascade else "large")
+    
+    @property
+    def state_update_chain(self):
+        return self._get_chain("STATE_UPDATE_PROMPT")
+    
+    @property
+    def json_repair_chain(self):
+        return self._get_chain("JSON_REPAIR_PROMPT")
+    
+    def warm_up(self) -> None:
+        """Import dependencies and build all chains ahead of the first command"""
+        self.k8s_chain
+        self.git_chain
+        self.parser_chain
+        self.state_update_chain
+        self.json_repair_chain
+        if self.cascade:
+            for prompt_name in ("KUBERNETES_CLI_PROMPT", "GIT_CLI_PROMPT", "STATE_UPDATE_PROMPT"):
+                self._get_chain(prompt_name, "small")
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Structured output counters and repair / wasted-call rates per role"""
+        metrics = {}
+        for role, stats in self.output_stats.items():
+            calls = stats["calls"] or 1
+            metrics[role] = {
+                **stats,
+                "repair_rate": stats["repaired"] / calls,
+                "reask_rate": stats["reasked"] / calls,
+                "wasted_rate": stats["wasted"] / calls
+            }
+        return {
+            "structured_output": metrics,
+            "resilience": self.invoker.get_metrics(),
+            "cascade": {"enabled": self.cascade, **self.cascade_stats.get_metrics()}
+        }
+    
+    def _invoke_structured(self,
+                           role: str,
+                           chain: Any,
+                           inputs: Dict[str, Any],
+                           schema: Type[BaseModel],
+                           tier: Optional[str] = None) -> Optional[BaseModel]:
+        """Invoke a chain that should return JSON and validate it against schema.
         
-        self.parser_chain = LLMChain(
-            llm=self.llm,
-            prompt=COMMAND_PARSER_PROMPT,
-            verbose=True
-        )
+        Tries a local repair first and re-asks the model at most once; returns
+        None if the response is still unusable. With a tier, the call uses
+        that tier's resilience role (e.g. state_update_small).
+        """
+        stats = self.output_stats[role]
+        stats["calls"] += 1
         
-        self.state_update_chain = LLMChain(
-            llm=self.llm,
-            prompt=STATE_UPDATE_PROMPT,
-            verbose=True
-        )
+        text = self.invoker.invoke(f"{role}_{tier}" if tier else role, chain, inputs)["text"]
+        result, repaired, error = parse_structured(text, schema)
+        if result is not None:
+            stats["repaired" if repaired else "clean"] += 1
+            return result
+        
+        stats["reasked"] += 1
+        text = self.invoker.invoke("json_repair", self.json_repair_chain, {
+            "schema": schema_description(schema),
+            "response": text,
+            "error": error
+        })["text"]
+        result, _, error = parse_structured(text, schema)
+        if result is not None:
+            stats["reask_recovered"] += 1
+            return result
+        
+        stats["wasted"] += 1
+        logger.warning("Discarding unparseable %s response: %s", role, error)
+        return None
     
     def detect_command_type(self, command: str) -> str:
         """Detect if the command is kubectl, git, or something else"""
@@ -57,105 +176,151 @@ class TerminalSimulationChain:
     
     def parse_command(self, command: str) -> Dict[str, Any]:
         """Parse the command into structured components"""
-        response = self.parser_chain.invoke({"command": command})
+        parsed = self._invoke_structured(
+            "parser",
+            self.parser_chain,
+            {"command": command},
+            ParsedCommand
+        )
+        if parsed is not None:
+            return parsed.model_dump()
         
-        try:
-            # Extract JSON from response
-            parsed = json.loads(response["text"])
-            return parsed
-        except (json.JSONDecodeError, KeyError):
-            # Fallback parsing if LLM doesn't return valid JSON
-            tool = self.detect_command_type(command)
-            return {
-                "tool": tool,
-                "subcommand": "",
-                "options": [],
-                "args": [],
-                "valid": tool != "unknown"
-            }
+        # Fallback parsing if LLM doesn't return valid JSON
+        tool = self.detect_command_type(command)
+        return ParsedCommand(tool=tool, valid=tool != "unknown").model_dump()
     
     def process_command(self, 
                        command: str, 
                        environment_state: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """Process a terminal command and return the output and updated state"""
+        try:
+            return self._simulate_command(command, environment_state)
+        except LLMUnavailableError as e:
+            # Degrade to a clear error and keep the session state untouched
+            logger.warning("Terminal simulator unavailable: %s", e)
+            tool = self.detect_command_type(command)
+            parsed_command = ParsedCommand(tool=tool, valid=tool != "unknown").model_dump()
+            return SIMULATOR_UNAVAILABLE_OUTPUT, environment_state, parsed_command
+    
+    def _simulate_command(self,
+                          command: str,
+                          environment_state: Dict[str, Any]) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+        """Run the parser, simulation and state update chains for a command"""
         command_type = self.detect_command_type(command)
         parsed_command = self.parse_command(command)
         
-        # Format environment state for prompt
-        state_str = json.dumps(environment_state, indent=2)
-        
-        # Execute the appropriate chain based on command type
-        if command_type == "kubectl":
-            output = self.k8s_chain.invoke({
-                "command": command,
-                "environment_state": state_str
-            })["text"]
-            
-            # Update environment state
-            updated_state = self._update_environment_state(
-                command,
-                environment_state,
-                output,
-                "kubectl"
-            )
-            
-        elif command_type == "git":
-            output = self.git_chain.invoke({
-                "command": command,
-                "environment_state": state_str
-            })["text"]
-            
-            # Update environment state
-            updated_state = self._update_environment_state(
-                command,
-                environment_state,
-                output,
-                "git"
-            )
-            
-        else:
+        if command_type not in ("kubectl", "git"):
             # Handle unknown commands
             output = f"Command not recognized. This environment supports kubectl and git commands."
-            updated_state = environment_state
+            return output, environment_state, parsed_command
+        
+        if self.cascade:
+            output, state_updates = self._simulate_with_cascade(command, command_type, environment_state)
+        else:
+            output, state_updates = self._simulate_with_tier(command, command_type, environment_state, "large")
+        
+        # Update environment state
+        if state_updates is None:
+            return output, environment_state, parsed_command
+        updated_state = environment_state.copy()
+        self._apply_state_updates(updated_state, state_updates)
         
         return output, updated_state, parsed_command
     
-    def _update_environment_state(self, 
-                                 command: str, 
-                                 current_state: Dict[str, Any],
-                                 command_output: str,
-                                 tool_type: str) -> Dict[str, Any]:
-        """Update the environment state based on the command and output"""
+    def _simulate_with_cascade(self,
+                               command: str,
+                               command_type: str,
+                               environment_state: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Try the small model and escalate to the large one if its result fails the consistency check"""
+        start = time.monotonic()
+        try:
+            output, state_updates = self._simulate_with_tier(command, command_type, environment_state, "small")
+        except LLMUnavailableError as e:
+            # The small model timing out or being unavailable is no reason to fail the command
+            logger.warning("Small model failed for %r: %s", command, e)
+            output, state_updates, reason = None, None, "small_model_failed"
+        else:
+            reason = check_simulation(command, command_type, output, state_updates, environment_state)
+        small_seconds = time.monotonic() - start
+        
+        if reason is None:
+            self.cascade_stats.record(small_seconds, None)
+            return output, state_updates
+        
+        logger.info("Escalating %r to the large model: %s", command, reason)
+        start = time.monotonic()
+        output, state_updates = self._simulate_with_tier(command, command_type, environment_state, "large")
+        self.cascade_stats.record(small_seconds, reason, time.monotonic() - start)
+        return output, state_updates
+    
+    def _simulate_with_tier(self,
+                            command: str,
+                            command_type: str,
+                            environment_state: Dict[str, Any],
+                            tier: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Simulate the command output and compute the state changes with one model tier"""
+        prompt_name = "KUBERNETES_CLI_PROMPT" if command_type == "kubectl" else "GIT_CLI_PROMPT"
+        
+        # Format environment state for prompt
+        state_str = json.dumps(environment_state, indent=2)
+        
+        output = self.invoker.invoke(f"simulation_{tier}", self._get_chain(prompt_name, tier), {
+            "command": command,
+            "environment_state": state_str
+        })["text"]
+        
+        state_updates = self._compute_state_updates(
+            command,
+            environment_state,
+            output,
+            command_type,
+            tier
+        )
+        return output, state_updates
+    
+    def _compute_state_updates(self, 
+                               command: str, 
+                               current_state: Dict[str, Any],
+                               command_output: str,
+                               tool_type: str,
+                               tier: str = "large") -> Optional[Dict[str, Any]]:
+        """Ask the state update chain how the command changed the environment.
+        
+        Returns None if no usable state delta could be obtained.
+        """
         try:
             # Use the state update chain to determine changes
-            response = self.state_update_chain.invoke({
-                "command": command,
-                "current_state": json.dumps(current_state, indent=2),
-                "command_output": command_output,
-                "tool_type": tool_type
-            })
-            
-            # Try to parse the updated state
-            state_updates = json.loads(response["text"])
-            
-            # Apply updates to current state
-            updated_state = current_state.copy()
-            self._apply_state_updates(updated_state, state_updates)
-            
-            return updated_state
+            state_delta = self._invoke_structured(
+                "state_update",
+                self._get_chain("STATE_UPDATE_PROMPT", tier),
+                {
+                    "command": command,
+                    "current_state": json.dumps(current_state, indent=2),
+                    "command_output": command_output,
+                    "tool_type": tool_type
+                },
+                StateDelta,
+                tier
+            )
+            return state_delta.to_updates() if state_delta is not None else None
             
-        except (json.JSONDecodeError, KeyError, Exception) as e:
-            # If there's an error, return the current state unchanged
-            print(f"Error updating state: {str(e)}")
-            return current_state
+        except Exception as e:
+            # If there's an error, leave the current state unchanged
+            logger.warning("Error updating state: %s", e)
+            return None
     
     def _apply_state_updates(self, 
                             current_state: Dict[str, Any], 
                             updates: Dict[str, Any]) -> None:
-        """Apply nested updates to the current state"""
+        """Apply nested updates to the current state.
+        
+        Nested dictionaries are copied before being updated, so the previous
+        state is never modified and untouched keys keep sharing their values.
+        """
         for key, value in updates.items():
             if isinstance(value, dict) and key in current_state and isinstance(current_state[key], dict):
                 # Recursive update for nested dictionaries
+                current_state[key] = dict(current_state[key])
                 self._apply_state_updates(current_state[key], value)
             else:
                 # Direct update for non-dict values or new keys
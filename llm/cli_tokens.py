@@ -0,0 +1,41 @@
+from typing import Iterable, List, Optional
+import shlex
+
+# Tokenizing helpers for the simulated kubectl and git command lines, shared by
+# the model cascade's consistency checks and command autocompletion.
+
+# Flags whose value is the next token, e.g. `kubectl get pods -n default nginx`
+KUBECTL_VALUE_FLAGS = (
+    "-n", "--namespace", "-o", "--output", "-l", "--selector", "-f", "--filename",
+    "-c", "--container", "--context", "--kubeconfig"
+)
+GIT_VALUE_FLAGS = ("-m", "--message", "-b", "-B", "-c", "-C")
+
+def tokenize(command: str) -> List[str]:
+    """Split a command line like a shell would, falling back to whitespace on unbalanced quotes"""
+    try:
+        return shlex.split(command)
+    except ValueError:
+        return command.split()
+
+def positional_args(args: Iterable[str], value_flags: Iterable[str]) -> List[str]:
+    """Drop flags, and the values of flags that take one, from a token list"""
+    positional: List[str] = []
+    skip_next = False
+    for arg in args:
+        if skip_next:
+            skip_next = False
+        elif arg in value_flags:
+            skip_next = True
+        elif not arg.startswith("-"):
+            positional.append(arg)
+    return positional
+
+def namespace_flag(tokens: List[str]) -> Optional[str]:
+    """The namespace given with -n / --namespace / --namespace=, if any"""
+    for i, token in enumerate(tokens):
+        if token in ("-n", "--namespace") and i + 1 < len(tokens):
+            return tokens[i + 1]
+        if token.startswith("--namespace="):
+            return token.split("=", 1)[1]
+    return None
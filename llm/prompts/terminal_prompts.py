@@ -74,4 +74,21 @@ Instructions:
 
 Return ONLY the JSON representation of state changes.
 """
-)
\ No newline at end of file
+)
+
+# Targeted re-ask when a response couldn't be parsed or repaired locally
+JSON_REPAIR_PROMPT = PromptTemplate(
+    input_variables=["schema", "response", "error"],
+    template="""
+The following response was supposed to be a single JSON object matching this JSON schema:
+{schema}
+
+RESPONSE:
+{response}
+
+PARSE ERROR:
+{error}
+
+Return ONLY the corrected JSON object, with no code fences, comments or explanations.
+"""
+)
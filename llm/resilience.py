@@ -0,0 +1,306 @@
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Optional, Set
+import logging
+import os
+import random
+import threading
+import time
+
+# Deadlines, jittered retries, hedged requests and a circuit breaker around
+# LLM chain calls. Chains are plain objects with a blocking invoke(inputs), so
+# the layer can be exercised with a fake chain that sleeps or raises.
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying (timeouts, conflicts, rate limits, upstream errors)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# OpenAI client errors that are transient, matched by name to avoid importing openai here
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+class LLMUnavailableError(Exception):
+    """The LLM call failed after retries, or the circuit breaker is open"""
+
+class CircuitOpenError(LLMUnavailableError):
+    """Calls are being short-circuited until the breaker's reset timeout passes"""
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+class CallPolicy:
+    def __init__(self,
+                 timeout: float,
+                 max_retries: int = 2,
+                 backoff_base: float = 0.25,
+                 backoff_max: float = 2.0,
+                 hedge_percentile: Optional[float] = None,
+                 hedge_min_samples: int = 20):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Send a duplicate request once an attempt is slower than this latency percentile
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+    
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+def _hedge_percentile_from_env() -> Optional[float]:
+    value = os.getenv("LLM_HEDGE_PERCENTILE")
+    return float(value) if value else None
+
+def default_policies() -> Dict[str, CallPolicy]:
+    """Per-role policies; terminal roles are latency sensitive and may be hedged.
+    
+    Terminal simulation roles are per model tier, so small and large model
+    latencies are tracked (and hedged) separately.
+    """
+    hedge = _hedge_percentile_from_env()
+    terminal_timeout = float(os.getenv("LLM_TERMINAL_TIMEOUT", "20"))
+    policies = {
+        "chat": CallPolicy(timeout=float(os.getenv("LLM_CHAT_TIMEOUT", "45"))),
+        "introduction": CallPolicy(timeout=float(os.getenv("LLM_CHAT_TIMEOUT", "45"))),
+        "assessment": CallPolicy(timeout=60, max_retries=0),
+        "parser": CallPolicy(timeout=10, hedge_percentile=hedge),
+        "json_repair": CallPolicy(timeout=10, max_retries=1)
+    }
+    for tier in ("small", "large"):
+        policies[f"simulation_{tier}"] = CallPolicy(timeout=terminal_timeout, hedge_percentile=hedge)
+        policies[f"state_update_{tier}"] = CallPolicy(timeout=terminal_timeout, hedge_percentile=hedge)
+    return policies
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial call through after reset_timeout"""
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+    
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+    
+    def record_ignored(self) -> None:
+        """A call failed for a reason unrelated to upstream health; only frees a half-open trial"""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+    
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+    
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+    
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+class ResilientInvoker:
+    def __init__(self,
+                 policies: Optional[Dict[str, CallPolicy]] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 max_workers: Optional[int] = None):
+        self.policies = policies or default_policies()
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+        )
+        self.max_workers = max_workers or int(os.getenv("LLM_MAX_CONCURRENT_CALLS", "32"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm-call")
+        # Submitted calls that haven't finished, including ones nobody waits for any more:
+        # a running call can't be cancelled, its thread stays busy until the client times out
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+    
+    def client_options(self, *roles: str) -> Dict[str, Any]:
+        """Keyword arguments for an OpenAI chat client used by these roles.
+        
+        The client's own timeout ends a request that outlives the deadline, so
+        an abandoned call frees its thread, and its own retries are disabled so
+        they don't stack on top of the ones here.
+        """
+        timeouts = [self.policies[role].timeout for role in roles if role in self.policies]
+        return {"request_timeout": max(timeouts) if timeouts else 30, "max_retries": 0}
+    
+    def _count(self, role: str, key: str) -> None:
+        stats = self._stats.setdefault(
+            role,
+            {
+                "calls": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0,
+                "failures": 0, "short_circuited": 0, "abandoned": 0
+            }
+        )
+        stats[key] += 1
+    
+    def _submit(self, chain: Any, inputs: Dict[str, Any]) -> Future:
+        with self._in_flight_lock:
+            self._in_flight += 1
+        future = self._executor.submit(chain.invoke, inputs)
+        future.add_done_callback(self._call_finished)
+        return future
+    
+    def _call_finished(self, future: Future) -> None:
+        with self._in_flight_lock:
+            self._in_flight -= 1
+    
+    def invoke(self, role: str, chain: Any, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Call chain.invoke(inputs) under the role's retry and hedging policy.
+        
+        The role's timeout is one budget for the whole call: retries, backoff
+        and hedges all have to fit in it. This blocks, so async code should
+        run it in an executor.
+        """
+        policy = self.policies.get(role) or CallPolicy(timeout=30)
+        self._count(role, "calls")
+        
+        if not self.breaker.allow():
+            self._count(role, "short_circuited")
+            raise CircuitOpenError(f"LLM circuit breaker is open, skipping {role} call")
+        
+        deadline = time.monotonic() + policy.timeout
+        last_error: Optional[BaseException] = None
+        for attempt in range(policy.max_retries + 1):
+            if attempt:
+                delay = policy.backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    break
+                self._count(role, "retries")
+                time.sleep(delay)
+            try:
+                result = self._attempt(role, chain, inputs, policy, deadline)
+            except Exception as e:
+                last_error = e
+                if isinstance(e, TimeoutError):
+                    self._count(role, "timeouts")
+                if not is_retryable(e) or time.monotonic() >= deadline:
+                    break
+                logger.warning("Retryable error on %s call (attempt %d): %s", role, attempt + 1, e)
+                continue
+            self.breaker.record_success()
+            return result
+        
+        self._count(role, "failures")
+        # Only errors that say the upstream is unhealthy count towards opening the breaker. A 400
+        # from one learner's oversized state or a bad prompt must not cut off every other caller
+        if last_error is not None and is_retryable(last_error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_ignored()
+        raise LLMUnavailableError(f"{role} call failed: {last_error}") from last_error
+    
+    def _attempt(self,
+                 role: str,
+                 chain: Any,
+                 inputs: Dict[str, Any],
+                 policy: CallPolicy,
+                 deadline: float) -> Dict[str, Any]:
+        """One attempt bound by the call's deadline, hedged with a duplicate request if it runs slow"""
+        tracker = self._latency.setdefault(role, LatencyTracker())
+        start = time.monotonic()
+        
+        hedge_delay = None
+        if policy.hedge_percentile is not None and len(tracker) >= policy.hedge_min_samples:
+            hedge_delay = tracker.percentile(policy.hedge_percentile)
+        
+        primary = self._submit(chain, inputs)
+        pending: Set[Future] = {primary}
+        if hedge_delay is not None and start + hedge_delay < deadline:
+            done, _ = wait(pending, timeout=hedge_delay)
+            # A hedge that would only queue behind busy threads can't win
+            if not done and self._in_flight < self.max_workers:
+                self._count(role, "hedges")
+                pending.add(self._submit(chain, inputs))
+        
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count(role, "hedge_wins")
+                    self._abandon(role, pending)
+                    tracker.record(time.monotonic() - start)
+                    return future.result()
+                error = future.exception()
+        
+        self._abandon(role, pending)
+        if error is not None and not pending:
+            raise error
+        raise TimeoutError(f"{role} call exceeded its {policy.timeout}s deadline")
+    
+    def _abandon(self, role: str, futures: Set[Future]) -> None:
+        for future in futures:
+            # Queued calls are dropped; running ones keep their thread until the client gives up
+            if not future.cancel():
+                self._count(role, "abandoned")
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        latency = {
+            role: {"p50": tracker.percentile(50), "p99": tracker.percentile(99)}
+            for role, tracker in self._latency.items()
+        }
+        return {
+            "breaker": self.breaker.state,
+            "calls": self._stats,
+            "latency_seconds": latency,
+            "in_flight": self._in_flight,
+            "max_workers": self.max_workers
+        }
+
+@lru_cache()
+def get_default_invoker() -> ResilientInvoker:
+    """Process-wide invoker, so chat and terminal chains share one breaker for the upstream LLM"""
+    return ResilientInvoker()
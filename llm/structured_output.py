@@ -0,0 +1,144 @@
+from pydantic import BaseModel, ConfigDict, ValidationError
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Type, TypeVar
+import json
+import re
+
+# Typed schemas for the JSON the terminal chains ask the model for, plus a
+# cheap local repair pass so a response wrapped in fences or prose isn't wasted.
+
+class ParsedCommand(BaseModel):
+    tool: str = "unknown"
+    subcommand: str = ""
+    options: List[str] = []
+    args: List[str] = []
+    valid: bool = False
+
+class StateDelta(BaseModel):
+    """Changes to a session's environment state; unknown keys are kept as-is"""
+    model_config = ConfigDict(extra="allow")
+    
+    # K8s elements
+    current_namespace: Optional[str] = None
+    namespaces: Optional[List[str]] = None
+    pods: Optional[Dict[str, Any]] = None
+    deployments: Optional[Dict[str, Any]] = None
+    services: Optional[Dict[str, Any]] = None
+    
+    # Git elements
+    initialized: Optional[bool] = None
+    current_branch: Optional[str] = None
+    branches: Optional[List[str]] = None
+    commits: Optional[List[Any]] = None
+    staged_files: Optional[List[str]] = None
+    modified_files: Optional[List[str]] = None
+    untracked_files: Optional[List[str]] = None
+    
+    def to_updates(self) -> Dict[str, Any]:
+        """Only the keys the model actually returned"""
+        return self.model_dump(exclude_unset=True)
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+def _structural_chars(text: str, start: int = 0) -> Iterator[Tuple[int, str]]:
+    """Yield (index, char) for every character outside string literals, respecting escapes.
+    
+    The quotes delimiting a string are yielded, its contents are not.
+    """
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                yield i, char
+        else:
+            if char == '"':
+                in_string = True
+            yield i, char
+
+def extract_json_object(text: str) -> Optional[str]:
+    """Return the outermost {...} object in text, respecting strings and escapes"""
+    start = text.find("{")
+    if start == -1:
+        return None
+    
+    depth = 0
+    for i, char in _structural_chars(text, start):
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    
+    # Unbalanced: fall back to the last closing brace
+    end = text.rfind("}")
+    return text[start:end + 1] if end > start else None
+
+def strip_trailing_commas(text: str) -> str:
+    """Drop commas directly before a closing bracket, leaving string contents untouched
+    
+    >>> strip_trailing_commas('{"branches": ["main", "feature/login",], "msg": "fix a, ]b",}')
+    '{"branches": ["main", "feature/login"], "msg": "fix a, ]b"}'
+    >>> strip_trailing_commas('{"args": ["pod", "api"], "current_branch": "main"}')
+    '{"args": ["pod", "api"], "current_branch": "main"}'
+    """
+    drop = set()
+    pending_comma = None
+    for i, char in _structural_chars(text):
+        if char == ",":
+            pending_comma = i
+        elif char in "}]":
+            if pending_comma is not None:
+                drop.add(pending_comma)
+            pending_comma = None
+        elif not char.isspace():
+            pending_comma = None
+    if not drop:
+        return text
+    return "".join(char for i, char in enumerate(text) if i not in drop)
+
+def repair_json(text: str) -> Optional[str]:
+    """Strip code fences and surrounding prose, then drop trailing commas"""
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    candidate = extract_json_object(text)
+    if candidate is None:
+        return None
+    return strip_trailing_commas(candidate)
+
+def _validate(candidate: str, schema: Type[SchemaT]) -> Tuple[Optional[SchemaT], Optional[str]]:
+    try:
+        return schema.model_validate(json.loads(candidate)), None
+    except (json.JSONDecodeError, ValidationError) as e:
+        return None, str(e)
+
+def parse_structured(text: str, schema: Type[SchemaT]) -> Tuple[Optional[SchemaT], bool, Optional[str]]:
+    """Parse text into schema, repairing it locally if needed.
+    
+    Returns (result, repaired, error); result is None if the text could not
+    be turned into a valid instance even after repair.
+    """
+    result, error = _validate(text, schema)
+    if result is not None:
+        return result, False, None
+    
+    candidate = repair_json(text)
+    if candidate is not None and candidate != text:
+        result, repair_error = _validate(candidate, schema)
+        if result is not None:
+            return result, True, None
+        error = repair_error
+    return None, False, error
+
+def schema_description(schema: Type[BaseModel]) -> str:
+    """Compact JSON schema to show the model when re-asking"""
+    return json.dumps(schema.model_json_schema(), separators=(",", ":"))